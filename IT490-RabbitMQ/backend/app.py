@@ -4,14 +4,45 @@ import os
 import time
 import logging
 import json
+import signal
+import threading
+import multiprocessing
+import db
+import ingest
+import store
+from concurrent.futures import Future, ThreadPoolExecutor
+from werkzeug.security import check_password_hash
+
+# Number of consumer processes, consumer threads per process and how many
+# unacked messages each consumer may hold
+WORKERS = int(os.environ.get('BACKEND_WORKERS', os.cpu_count() or 1))
+THREADS = int(os.environ.get('BACKEND_THREADS', 2))
+
+# Consumer threads per process for the 'store' queue. It carries the front
+# end's fire-and-forget PUT* writes, kept apart from 'request' so a burst of
+# writes never delays lookups and logins.
+STORE_THREADS = int(os.environ.get('BACKEND_STORE_THREADS', 1))
+
+# Number of processes consuming the 'ingest' queue
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 1))
+
+# Group commit: how many messages share one transaction, and how long to
+# wait for a batch to fill
+BATCH_SIZE = int(os.environ.get('BACKEND_BATCH_SIZE', 1))
+BATCH_WAIT = float(os.environ.get('BACKEND_BATCH_WAIT_MS', 5)) / 1000
+
+# Threads per process for VERIFY's password checks. hashlib releases the GIL
+# while hashing, so these run in parallel with each other and the consumers.
+verifier = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BACKEND_HASH_THREADS', os.cpu_count() or 1)))
+PREFETCH = int(os.environ.get('BACKEND_PREFETCH', 10))
 
 # tag::process_request[]
-def process_request(ch, method, properties, body):
+def handle_request(curr, request):
     """
-    Gets a request from the queue, acts on it, and returns a response to the
-    reply-to queue
+    Acts on a decoded request using the given cursor and returns the
+    response. Does not commit; the caller does once the work is done.
     """
-    request = json.loads(body)
     if 'action' not in request:
         response = {
             'success': False,
@@ -19,88 +50,302 @@ def process_request(ch, method, properties, body):
         }
     else:
         action = request['action']
-        if action == 'GETHASH':
-            data = request['data']
-            email = data['email']
-            logging.info(f"GETHASH request for {email} received")
-            curr.execute('SELECT hash FROM users WHERE email=%s;', (email,))
-            row =  curr.fetchone()
-            if row == None:
-                response = {'success': False}
-            else:
-                response = {'success': True, 'hash': row[0]}
-        elif action == 'REGISTER':
+        if action == 'REGISTER':
             data = request['data']
             email = data['email']
             hashed = data['hash']
             logging.info(f"REGISTER request for {email} received")
-            curr.execute('SELECT * FROM users WHERE email=%s;', (email,))
-            if curr.fetchone() != None:
+            # Inserts and reports a duplicate in one statement
+            db.execute(curr, 'register_user', (email, hashed))
+            if curr.fetchone() == None:
                 response = {'success': False, 'message': 'User already exists'}
             else:
-                curr.execute('INSERT INTO users VALUES (%s, %s);', (email, hashed))
-                conn.commit()
                 response = {'success': True}
+        elif action == 'VERIFY':
+            data = request['data']
+            email = data['email']
+            logging.info(f"VERIFY request for {email} received")
+            db.execute(curr, 'get_hash', (email,))
+            row = curr.fetchone()
+            if row == None:
+                response = {'success': False, 'message': 'Unknown user'}
+            else:
+                # Checked off the consumer thread; resolved after commit
+                return verifier.submit(verify, row[0], data['password'])
+        elif action in store.ACTIONS:
+            logging.info(f"{action} request received")
+            response = store.ACTIONS[action](curr, request['data'])
         else:
             response = {'success': False, 'message': "Unknown action"}
     logging.info(response)
+    return response
+
+def verify(hashed, password):
+    """
+    Checks a password against its hash; runs in the verifier pool
+    """
+    response = {'success': check_password_hash(hashed, password)}
+    logging.info(response)
+    return response
+
+def reply(ch, properties, response):
+    """
+    Sends a response to the request's reply-to queue, if it asked for one
+    """
+    if properties.reply_to is None:
+        return
     ch.basic_publish(
         exchange='',
         routing_key=properties.reply_to,
+        properties=pika.BasicProperties(
+            correlation_id=properties.correlation_id),
         body=json.dumps(response)
     )
 # end::process_request[]
 
-logging.basicConfig(level=logging.INFO)
+def connect(maxconn=None):
+    """
+    Repeatedly tries to connect to db and messaging, waiting up to 60s,
+    doubling backoff. Returns a database connection pool of DB_POOL_MAX
+    connections unless maxconn overrides it.
+    """
+    wait_time = 1
+    while True:
+        logging.info(f"Waiting {wait_time}s...")
+        time.sleep(wait_time)
+        if wait_time < 60:
+            wait_time = wait_time * 2
+        else:
+            wait_time = 60
+        try:
+            logging.info("Connecting to the database...")
+            pool = db.connect(maxconn=maxconn)
 
-# repeatedly try to connect to db and messaging, waiting up to 60s, doubling
-# backoff
-wait_time = 1
-while True:
-    logging.info(f"Waiting {wait_time}s...")
-    time.sleep(wait_time)
-    if wait_time < 60:
-        wait_time = wait_time * 2
-    else:
-        wait_time = 60
-    try:
-        logging.info("Connecting to the database...")
-        postgres_password = os.environ['POSTGRES_PASSWORD']
-        conn = psycopg2.connect(
-            host='database',
-            database='postgres',
-            user='postgres',
-            password=postgres_password
-        )
+            logging.info("Connecting to messaging service...")
+            connect_messaging().close()
 
-        logging.info("Connecting to messaging service...")
-        credentials = pika.PlainCredentials(
-            os.environ['RABBITMQ_DEFAULT_USER'],
-            os.environ['RABBITMQ_DEFAULT_PASS']
-        )
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host='messaging',
-                credentials=credentials
-            )
+            return pool
+        except psycopg2.OperationalError:
+            print(f"Unable to connect to database.")
+            continue
+        except pika.exceptions.AMQPConnectionError:
+            print("Unable to connect to messaging.")
+            continue
+
+def connect_messaging():
+    """
+    Opens a connection to the messaging service
+    """
+    credentials = pika.PlainCredentials(
+        os.environ['RABBITMQ_DEFAULT_USER'],
+        os.environ['RABBITMQ_DEFAULT_PASS']
+    )
+    return pika.BlockingConnection(
+        pika.ConnectionParameters(
+            host='messaging',
+            credentials=credentials
         )
+    )
+
+def execute(pool, requests):
+    """
+    Runs a batch of requests in one transaction on a pooled connection and
+    returns their responses once it has committed. With more than one
+    request each runs under a savepoint, so one failing request does not
+    undo the rest. If the connection turns out to be dead it is replaced
+    and the batch retried once. Never raises: a request that fails gets an
+    error response, so a malformed message is answered and acked instead of
+    killing the consumer and being redelivered forever.
+    """
+    for attempt in range(2):
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as curr:
+                    responses = [execute_one(curr, request, len(requests) > 1)
+                                 for request in requests]
+                conn.commit()
+            return [result(response) for response in responses]
+        except psycopg2.OperationalError:
+            logging.exception("Lost database connection")
+        except psycopg2.Error:
+            logging.exception("Request failed")
+            break
+        except Exception:
+            logging.exception("Request failed")
+            return [{'success': False, 'message': "Request failed"} for request in requests]
+    return [{'success': False, 'message': "Database error"} for request in requests]
+
+def result(response):
+    """
+    Waits for a response still being worked on in the verifier pool
+    """
+    if not isinstance(response, Future):
+        return response
+    try:
+        return response.result()
+    except Exception:
+        logging.exception("Request failed")
+        return {'success': False, 'message': "Request failed"}
 
-        break
+def execute_one(curr, request, savepoint):
+    """
+    Runs one request of a batch, rolling back just that request on error
+    """
+    if not savepoint:
+        return handle_request(curr, request)
+    curr.execute('SAVEPOINT request;')
+    try:
+        response = handle_request(curr, request)
     except psycopg2.OperationalError:
-        print(f"Unable to connect to database.")
-        continue
-    except pika.exceptions.AMQPConnectionError:
-        print("Unable to connect to messaging.")
-        continue
-curr = conn.cursor()
-channel = connection.channel()
-
-# create the request queue if it doesn't exist
-channel.queue_declare(queue='request')
-
-channel.basic_consume(queue='request', auto_ack=True,
-                      on_message_callback=process_request)
-
-# loops forever consuming from 'request' queue
-logging.info("Starting consumption...")
-channel.start_consuming()
\ No newline at end of file
+        raise
+    except psycopg2.Error:
+        logging.exception("Request failed")
+        curr.execute('ROLLBACK TO SAVEPOINT request;')
+        return {'success': False, 'message': "Database error"}
+    except Exception:
+        # e.g. a request missing its data; undo whatever it already wrote
+        logging.exception("Request failed")
+        curr.execute('ROLLBACK TO SAVEPOINT request;')
+        return {'success': False, 'message': "Request failed"}
+    curr.execute('RELEASE SAVEPOINT request;')
+    return response
+
+def consume(pool, stopping, queue='request'):
+    """
+    Consumer thread: consumes from queue ('request' or 'store'), collecting
+    up to BATCH_SIZE messages or waiting at most BATCH_WAIT seconds after
+    the first, then runs them in a single transaction. Replies are sent and
+    the messages acked only after the group commit. Returns once stopping is
+    set and raises if the connection is lost; either way anything still
+    unacked goes back to the queue.
+    """
+    connection = connect_messaging()
+    channel = connection.channel()
+
+    # create the queue if it doesn't exist
+    channel.queue_declare(queue=queue)
+    channel.basic_qos(prefetch_count=max(PREFETCH, BATCH_SIZE))
+
+    batch = []
+
+    def process_request(ch, method, properties, body):
+        """
+        Gets a request from the queue and adds it to the current batch
+        """
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = {}
+        batch.append((method, properties, request))
+
+    def flush():
+        """
+        Acts on the batch and returns each response to its reply-to queue
+        """
+        responses = execute(pool, [request for method, properties, request in batch])
+        for (method, properties, request), response in zip(batch, responses):
+            reply(channel, properties, response)
+        channel.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+        batch.clear()
+
+    consumer_tag = channel.basic_consume(queue=queue, on_message_callback=process_request)
+
+    logging.info(f"Worker {os.getpid()} starting consumption...")
+    deadline = None
+    while not stopping.is_set():
+        if batch:
+            connection.process_data_events(time_limit=max(0, deadline - time.monotonic()))
+        else:
+            connection.process_data_events(time_limit=1)
+            deadline = time.monotonic() + BATCH_WAIT
+        if batch and (len(batch) >= BATCH_SIZE or time.monotonic() >= deadline):
+            flush()
+
+    logging.info(f"Worker {os.getpid()} shutting down...")
+    # Stops deliveries; prefetched messages not yet in a batch are requeued
+    # when the connection closes
+    channel.basic_cancel(consumer_tag)
+    if batch:
+        flush()
+    connection.close()
+
+def serve(pool, stopping, queue='request'):
+    """
+    Runs consume() until stopping is set, reconnecting with backoff whenever
+    the connection to messaging is lost, so a broker restart does not quietly
+    take this thread's share of the worker's capacity with it
+    """
+    wait_time = 1
+    while not stopping.is_set():
+        started = time.monotonic()
+        try:
+            consume(pool, stopping, queue)
+        except Exception:
+            logging.exception("Consumer lost its connection to messaging")
+            if time.monotonic() - started > 60:
+                wait_time = 1
+            stopping.wait(wait_time)
+            wait_time = min(wait_time * 2, 60)
+
+def work(stopping):
+    """
+    Worker process: runs THREADS 'request' and STORE_THREADS 'store'
+    consumer threads sharing one database connection pool
+    """
+    # Shutdown is coordinated by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    pool = connect()
+    if pool.maxconn < THREADS + STORE_THREADS:
+        logging.warning(f"DB_POOL_MAX={pool.maxconn} is below BACKEND_THREADS={THREADS} + "
+                        f"BACKEND_STORE_THREADS={STORE_THREADS}; consumers will wait for connections")
+    threads = [threading.Thread(target=serve, args=(pool, stopping, queue))
+               for queue in ['request'] * THREADS + ['store'] * STORE_THREADS]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.closeall()
+
+def ingest_work(stopping):
+    """
+    Ingest process: consumes the 'ingest' queue with ingest.THREADS threads
+    sharing one database connection pool
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    pool = connect()
+    if pool.maxconn < ingest.THREADS:
+        logging.warning(f"DB_POOL_MAX={pool.maxconn} is below INGEST_THREADS={ingest.THREADS}; "
+                        "ingest threads will wait for connections")
+    ingest.consume(pool, connect_messaging(), stopping)
+    pool.closeall()
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == '__main__':
+    stopping = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    def start_worker(target):
+        worker = multiprocessing.Process(target=target, args=(stopping,))
+        worker.start()
+        return worker
+
+    targets = [work] * WORKERS + [ingest_work] * INGEST_WORKERS
+    workers = [start_worker(target) for target in targets]
+    logging.info(f"Started {WORKERS} workers and {INGEST_WORKERS} ingest workers")
+
+    # loops until asked to stop, replacing any worker that dies
+    while not stopping.wait(1):
+        for i, worker in enumerate(workers):
+            if not worker.is_alive():
+                logging.info(f"Worker {worker.pid} exited, restarting")
+                workers[i] = start_worker(targets[i])
+
+    # waits for workers to drain
+    for worker in workers:
+        worker.join()
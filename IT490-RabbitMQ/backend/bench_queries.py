@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of per-message database time for the hash lookup VERIFY
+does and REGISTER, comparing plain SQL (re-parsed and re-planned on every
+message) with the prepared statements in db.STATEMENTS. Each message runs
+in its own transaction, as in the consumer.
+
+    POSTGRES_PASSWORD=... python bench_queries.py --messages 2000
+
+Test users are created under a 'bench-' prefix and removed afterwards.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import psycopg2
+
+import db
+
+def plain_gethash(curr, email):
+    curr.execute('SELECT hash FROM users WHERE email=%s;', (email,))
+    return curr.fetchone()
+
+def prepared_gethash(curr, email):
+    db.execute(curr, 'get_hash', (email,))
+    return curr.fetchone()
+
+def plain_register(curr, email):
+    curr.execute('SELECT * FROM users WHERE email=%s;', (email,))
+    if curr.fetchone() == None:
+        curr.execute('INSERT INTO users VALUES (%s, %s);', (email, 'bench-hash'))
+
+def prepared_register(curr, email):
+    db.execute(curr, 'register_user', (email, 'bench-hash'))
+    return curr.fetchone()
+
+def measure(conn, fn, emails):
+    """
+    Returns per-message times in microseconds, committing after each
+    """
+    times = []
+    with conn.cursor() as curr:
+        for email in emails:
+            start = time.perf_counter()
+            fn(curr, email)
+            conn.commit()
+            times.append((time.perf_counter() - start) * 1e6)
+    return times
+
+def report(name, times):
+    times = sorted(times)
+    print(f"{name:20} mean {statistics.mean(times):8.1f}us  p50 {times[len(times) // 2]:8.1f}us  "
+          f"p99 {times[int(len(times) * 0.99)]:8.1f}us")
+
+def cleanup(conn):
+    with conn.cursor() as curr:
+        curr.execute("DELETE FROM users WHERE email LIKE 'bench-%%';")
+    conn.commit()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plain vs prepared statement timing")
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--host', default=os.environ.get('POSTGRES_HOST', 'database'))
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=args.host,
+        database='postgres',
+        user='postgres',
+        password=os.environ.get('POSTGRES_PASSWORD'),
+        connection_factory=db.PreparedConnection
+    )
+    cleanup(conn)
+    try:
+        report('REGISTER plain', measure(conn, plain_register,
+                                         ['bench-plain-%d' % i for i in range(args.messages)]))
+        report('REGISTER prepared', measure(conn, prepared_register,
+                                            ['bench-prepared-%d' % i for i in range(args.messages)]))
+        emails = ['bench-plain-%d' % (i % args.messages) for i in range(args.messages)]
+        report('VERIFY plain', measure(conn, plain_gethash, emails))
+        report('VERIFY prepared', measure(conn, prepared_gethash, emails))
+    finally:
+        cleanup(conn)
+        conn.close()
@@ -0,0 +1,244 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+# Hot statements, prepared once per connection and then run by name:
+# name -> (parameter types, SQL)
+STATEMENTS = {
+    'get_hash': (
+        ('varchar',),
+        'SELECT hash FROM users WHERE email=$1'),
+    'register_user': (
+        ('varchar', 'varchar'),
+        'INSERT INTO users VALUES ($1, $2) ON CONFLICT (email) DO NOTHING RETURNING email'),
+    'get_summoner_by_name': (
+        ('varchar', 'varchar', 'varchar', 'float8'),
+        'SELECT summoner_id, account_id, puuid, name, profile_icon_id, revision_date, summoner_level '
+        'FROM summoners WHERE region=$1 AND lower(name)=lower($2) AND key_id=$3 '
+        'AND updated_at > now() - make_interval(secs => $4)'),
+    'get_summoner_by_puuid': (
+        ('varchar', 'float8'),
+        'SELECT summoner_id, account_id, puuid, name, profile_icon_id, revision_date, summoner_level '
+        'FROM summoners WHERE puuid=$1 AND updated_at > now() - make_interval(secs => $2)'),
+    'put_summoner': (
+        ('varchar', 'varchar', 'varchar', 'varchar', 'varchar', 'varchar', 'integer', 'bigint', 'integer'),
+        'INSERT INTO summoners VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) '
+        'ON CONFLICT (puuid) DO UPDATE SET key_id=$2, region=$3, summoner_id=$4, account_id=$5, name=$6, '
+        'profile_icon_id=$7, revision_date=$8, summoner_level=$9, updated_at=now()'),
+    'get_league': (
+        ('varchar', 'varchar', 'float8'),
+        'SELECT queue_type, tier, rank, league_points, wins, losses FROM league_entries '
+        'WHERE summoner_id=$1 AND game=$2 AND updated_at > now() - make_interval(secs => $3) '
+        'ORDER BY position'),
+    'delete_league': (
+        ('varchar', 'varchar'),
+        'DELETE FROM league_entries WHERE summoner_id=$1 AND game=$2'),
+    'put_league_entry': (
+        ('varchar', 'varchar', 'smallint', 'varchar', 'varchar', 'varchar', 'integer', 'integer', 'integer'),
+        'INSERT INTO league_entries VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)'),
+    'get_tft_match': (
+        ('varchar', 'varchar'),
+        'SELECT game_datetime, game_length, game_version, queue_id, tft_set_number '
+        'FROM tft_matches WHERE match_id=$1 AND key_id=$2'),
+    'get_tft_participants': (
+        ('varchar', 'varchar'),
+        'SELECT puuid, placement, level FROM tft_participants WHERE match_id=$1 AND key_id=$2 '
+        'ORDER BY placement'),
+    'get_tft_units': (
+        ('varchar', 'varchar'),
+        'SELECT puuid, character_id, tier, rarity FROM tft_units WHERE match_id=$1 AND key_id=$2 '
+        'ORDER BY puuid, slot'),
+    'put_tft_match': (
+        ('varchar', 'varchar', 'bigint', 'real', 'varchar', 'integer', 'integer'),
+        'INSERT INTO tft_matches VALUES ($1, $2, $3, $4, $5, $6, $7) '
+        'ON CONFLICT (match_id, key_id) DO NOTHING RETURNING match_id'),
+    'put_tft_participant': (
+        ('varchar', 'varchar', 'varchar', 'smallint', 'smallint'),
+        'INSERT INTO tft_participants VALUES ($1, $2, $3, $4, $5)'),
+    'put_tft_unit': (
+        ('varchar', 'varchar', 'varchar', 'smallint', 'varchar', 'smallint', 'smallint'),
+        'INSERT INTO tft_units VALUES ($1, $2, $3, $4, $5, $6, $7)'),
+    'count_tft_participant': (
+        ('varchar', 'varchar'),
+        'INSERT INTO tft_counted VALUES ($1, $2) ON CONFLICT (match_id, puuid) DO NOTHING RETURNING puuid'),
+    'add_tft_player_game': (
+        ('varchar', 'smallint', 'smallint'),
+        'INSERT INTO tft_player_stats VALUES ($1, 1, ($2 <= 4)::int, $2, $3, '
+        'array_fill(0, ARRAY[$2 - 1]) || 1 || array_fill(0, ARRAY[8 - $2])) '
+        'ON CONFLICT (puuid) DO UPDATE SET games=tft_player_stats.games + 1, '
+        'top4=tft_player_stats.top4 + EXCLUDED.top4, '
+        'placement_sum=tft_player_stats.placement_sum + $2, '
+        'level_sum=tft_player_stats.level_sum + $3, '
+        'placements[$2]=tft_player_stats.placements[$2] + 1'),
+    'add_tft_player_unit': (
+        ('varchar', 'varchar', 'smallint'),
+        'INSERT INTO tft_player_units VALUES ($1, $2, $3, 1) '
+        'ON CONFLICT (puuid, character_id, tier) DO UPDATE SET games=tft_player_units.games + 1'),
+    'get_tft_player_stats': (
+        ('varchar',),
+        'SELECT games, top4, placement_sum, level_sum, placements FROM tft_player_stats WHERE puuid=$1'),
+    'get_tft_player_units': (
+        ('varchar', 'integer'),
+        'SELECT character_id, tier, games FROM tft_player_units WHERE puuid=$1 '
+        'ORDER BY games DESC, tier DESC, character_id LIMIT $2'),
+    'get_tft_match_ids': (
+        ('varchar', 'varchar', 'integer', 'integer'),
+        'SELECT m.match_id FROM tft_participants p JOIN tft_matches m USING (match_id, key_id) '
+        'WHERE p.puuid=$1 AND p.key_id=$2 ORDER BY m.game_datetime DESC, m.match_id DESC '
+        'OFFSET $3 LIMIT $4'),
+    'stored_tft_matches': (
+        ('varchar[]', 'varchar'),
+        'SELECT match_id FROM tft_matches WHERE match_id = ANY($1) AND key_id=$2'),
+    'put_lol_match': (
+        ('varchar', 'varchar', 'bigint', 'integer', 'integer', 'jsonb'),
+        'INSERT INTO lol_matches VALUES ($1, $2, $3, $4, $5, $6) '
+        'ON CONFLICT (match_id, key_id) DO NOTHING RETURNING match_id'),
+    'put_lol_match_player': (
+        ('varchar', 'varchar', 'varchar'),
+        'INSERT INTO lol_match_players VALUES ($1, $2, $3)'),
+    'stored_lol_matches': (
+        ('varchar[]', 'varchar'),
+        'SELECT match_id FROM lol_matches WHERE match_id = ANY($1) AND key_id=$2'),
+    'get_ingest_state': (
+        ('varchar', 'varchar', 'float8'),
+        'SELECT last_match_id, updated_at > now() - make_interval(secs => $3) '
+        'FROM ingest_state WHERE puuid=$1 AND game=$2'),
+    'put_ingest_state': (
+        ('varchar', 'varchar', 'varchar'),
+        'INSERT INTO ingest_state VALUES ($1, $2, $3) '
+        'ON CONFLICT (puuid, game) DO UPDATE SET last_match_id=$3, updated_at=now()'),
+}
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    Connection that remembers which STATEMENTS it has prepared
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def prepare(curr, name):
+    """
+    Prepares a named statement on the cursor's connection. Prepared
+    statements outlive the transaction, so this happens once per connection.
+    """
+    types, sql = STATEMENTS[name]
+    curr.execute(f"PREPARE {name} ({', '.join(types)}) AS {sql};")
+    curr.connection.prepared.add(name)
+
+def execute(curr, name, params):
+    """
+    Executes a named statement from STATEMENTS, preparing it on the cursor's
+    connection the first time
+    """
+    if name not in curr.connection.prepared:
+        prepare(curr, name)
+    placeholders = ', '.join(['%s'] * len(params))
+    curr.execute(f"EXECUTE {name} ({placeholders});", params)
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections. Borrowers block while all
+    maxconn connections are in use. Connections idle for longer than
+    check_after seconds are checked with SELECT 1 before being handed out,
+    and any connection that fails with OperationalError is closed and
+    replaced instead of being returned to the pool.
+    """
+
+    def __init__(self, minconn=None, maxconn=None, check_after=None, **connect_args):
+        self.minconn = minconn or int(os.environ.get('DB_POOL_MIN', 1))
+        self.maxconn = maxconn or int(os.environ.get('DB_POOL_MAX', 4))
+        self.check_after = check_after or float(os.environ.get('DB_POOL_CHECK_AFTER', 30))
+        self.pool = psycopg2.pool.ThreadedConnectionPool(self.minconn, self.maxconn, **connect_args)
+        self.available = threading.BoundedSemaphore(self.maxconn)
+        self.last_used = {}
+
+    def healthy(self, conn):
+        """
+        Returns whether a connection still works, checking with the server
+        only if it has been idle for a while
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0) < self.check_after:
+            return True
+        try:
+            with conn.cursor() as curr:
+                curr.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except psycopg2.OperationalError:
+            return False
+
+    def getconn(self):
+        """
+        Borrows a healthy connection, opening a new one to replace any that
+        have died
+        """
+        self.available.acquire()
+        try:
+            while True:
+                conn = self.pool.getconn()
+                if self.healthy(conn):
+                    return conn
+                logging.info("ConnectionPool: replacing dead connection")
+                self.pool.putconn(conn, close=True)
+        except Exception:
+            self.available.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """
+        Returns a connection, closing it instead if close is set or it broke
+        """
+        close = close or conn.closed
+        if not close:
+            self.last_used[id(conn)] = time.monotonic()
+        else:
+            self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=close)
+        self.available.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of a with block. The
+        transaction is rolled back if the block raises; a connection that
+        raised OperationalError is discarded.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, close=True)
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        self.pool.closeall()
+
+def connect(minconn=None, maxconn=None):
+    """
+    Opens a pool on the compose database
+    """
+    return ConnectionPool(
+        minconn, maxconn,
+        connection_factory=PreparedConnection,
+        host='database',
+        database='postgres',
+        user='postgres',
+        password=os.environ['POSTGRES_PASSWORD']
+    )
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+
+import db
+import riot
+import store
+
+QUEUE = 'ingest'
+
+# Failed messages wait RETRY_DELAY seconds in RETRY_QUEUE before going back
+# on QUEUE, at most MAX_RETRIES times; after that they are dropped
+RETRY_QUEUE = 'ingest.retry'
+RETRY_DELAY = float(os.environ.get('INGEST_RETRY_DELAY', 30))
+MAX_RETRIES = int(os.environ.get('INGEST_MAX_RETRIES', 3))
+
+# Players ingested at once per process, and how many ingest messages each
+# process may hold unacked (at least THREADS so no thread sits idle). Riot
+# calls are paced per key anyway, so more threads mostly means more waiting.
+THREADS = int(os.environ.get('INGEST_THREADS', 1))
+PREFETCH = max(int(os.environ.get('INGEST_PREFETCH', 8)), THREADS)
+
+# How many match IDs to ask Riot for at a time, and the most new matches
+# stored for a player in one go. A new player costs up to
+# 2 x (1 + MAX_MATCHES) calls on their own key.
+PAGE_SIZE = int(os.environ.get('INGEST_PAGE_SIZE', 20))
+MAX_MATCHES = int(os.environ.get('INGEST_MAX_MATCHES', 10))
+
+# game -> (match IDs path, match path, their Riot method names, statement
+# listing stored IDs, store action)
+GAMES = {
+    'TFT': ('/tft/match/v1/matches/by-puuid/{}/ids', '/tft/match/v1/matches/{}',
+            ('tft-match-v1.ids-by-puuid', 'tft-match-v1.match'),
+            'stored_tft_matches', store.put_tft_match),
+    'League': ('/lol/match/v5/matches/by-puuid/{}/ids', '/lol/match/v5/matches/{}',
+               ('match-v5.ids-by-puuid', 'match-v5.match'),
+               'stored_lol_matches', store.put_lol_match),
+}
+
+def new_match_ids(base_url, path, method, puuid, apikey, last_match_id):
+    """
+    Pages through a player's match IDs, newest first, until reaching the
+    newest one already ingested or MAX_MATCHES
+    """
+    match_ids = []
+    start = 0
+    while len(match_ids) < MAX_MATCHES:
+        count = min(PAGE_SIZE, MAX_MATCHES - len(match_ids))
+        page = riot.client.get(
+            base_url + path.format(puuid) + f"?start={start}&count={count}", apikey, method) or []
+        for match_id in page:
+            if match_id == last_match_id:
+                return match_ids
+            match_ids.append(match_id)
+        if len(page) < count:
+            break
+        start += count
+    return match_ids
+
+def ingest_game(pool, game, puuid, region, apikey):
+    """
+    Stores a player's matches of one game played since the last ingest.
+    Riot is called outside any transaction; the matches and the player's
+    new last_match_id are then written in one, so a message that is
+    redelivered after a crash simply redoes the work.
+    """
+    ids_path, match_path, (ids_method, match_method), stored_statement, put = GAMES[game]
+    with pool.connection() as conn:
+        with conn.cursor() as curr:
+            db.execute(curr, 'get_ingest_state', (puuid, game, 0))
+            row = curr.fetchone()
+        conn.rollback()
+    last_match_id = row[0] if row else None
+
+    base_url = riot.host(riot.routing(region))
+    match_ids = new_match_ids(base_url, ids_path, ids_method, puuid, apikey, last_match_id)
+    if match_ids:
+        with pool.connection() as conn:
+            with conn.cursor() as curr:
+                db.execute(curr, stored_statement, (match_ids, riot.key_id(apikey)))
+                stored = {row[0] for row in curr.fetchall()}
+            conn.rollback()
+        # Only bodies we don't have yet are downloaded
+        matches = [riot.client.get(base_url + match_path.format(match_id), apikey, match_method)
+                   for match_id in match_ids if match_id not in stored]
+    else:
+        matches = []
+
+    with pool.connection() as conn:
+        with conn.cursor() as curr:
+            for match in matches:
+                if match is not None:
+                    put(curr, {'match': match, 'keyId': riot.key_id(apikey)})
+            db.execute(curr, 'put_ingest_state',
+                       (puuid, game, match_ids[0] if match_ids else last_match_id or ''))
+        conn.commit()
+    logging.info(f"Ingest: {len(matches)} new {game} matches for {puuid}")
+
+def ingest(pool, request):
+    """
+    Acts on one message: {'action': 'INGEST', 'data': {puuid, region, apikey}}
+    """
+    data = request['data']
+    for game in GAMES:
+        ingest_game(pool, game, data['puuid'], data['region'], data['apikey'])
+
+def consume(pool, connection, stopping):
+    """
+    Consumes the 'ingest' queue until stopping is set. Up to PREFETCH
+    messages are delivered at once and worked on by THREADS threads. Each
+    is acked only after its transaction commits. A message that fails is
+    retried after RETRY_DELAY, up to MAX_RETRIES times, with the count kept
+    in its x-retries header.
+    """
+    channel = connection.channel()
+    channel.queue_declare(queue=QUEUE)
+    # Messages expire out of the retry queue straight back onto QUEUE
+    channel.queue_declare(queue=RETRY_QUEUE, arguments={
+        'x-message-ttl': int(RETRY_DELAY * 1000),
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': QUEUE,
+    })
+    channel.basic_qos(prefetch_count=PREFETCH)
+    executor = ThreadPoolExecutor(max_workers=THREADS)
+
+    def settle(method, properties, body, ok):
+        """
+        Acks a message, first queueing a retry if it failed; runs on the
+        connection's thread
+        """
+        if not ok:
+            retries = (properties.headers or {}).get('x-retries', 0)
+            if retries < MAX_RETRIES:
+                channel.basic_publish(
+                    exchange='',
+                    routing_key=RETRY_QUEUE,
+                    properties=pika.BasicProperties(headers={'x-retries': retries + 1}),
+                    body=body)
+            else:
+                logging.error(f"Ingest: dropping message after {retries} retries")
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def run(method, properties, body):
+        """
+        Ingests one message on a worker thread
+        """
+        try:
+            ingest(pool, json.loads(body))
+            ok = True
+        except Exception:
+            logging.exception("Ingest: failed")
+            ok = False
+        connection.add_callback_threadsafe(lambda: settle(method, properties, body, ok))
+
+    def on_message(ch, method, properties, body):
+        executor.submit(run, method, properties, body)
+
+    consumer_tag = channel.basic_consume(queue=QUEUE, on_message_callback=on_message)
+
+    logging.info(f"Ingest worker {os.getpid()} starting consumption...")
+    while not stopping.is_set():
+        connection.process_data_events(time_limit=1)
+
+    logging.info(f"Ingest worker {os.getpid()} shutting down...")
+    channel.basic_cancel(consumer_tag)
+    # Finishes what was already delivered and sends its acks
+    executor.shutdown(wait=True)
+    connection.process_data_events(time_limit=0)
+    connection.close()
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ratelimit
+
+# Regional routing values for the match APIs, by platform
+ROUTING = {
+    'na1': 'americas', 'br1': 'americas', 'la1': 'americas', 'la2': 'americas', 'oc1': 'americas',
+    'euw1': 'europe', 'eun1': 'europe', 'tr1': 'europe', 'ru': 'europe',
+    'kr': 'asia', 'kr1': 'asia', 'jp1': 'asia',
+}
+
+class RiotError(Exception):
+    """
+    Raised when Riot answers with an error other than 404
+    """
+
+class RiotClient:
+    """
+    Keep-alive connection to the Riot API for the ingest worker. Calls are
+    paced per API key by the same header-driven limiter as the front end's,
+    held to INGEST_RATE_SHARE of each limit so pages being served with the
+    key keep the rest. Calls that are rate limited anyway are retried once
+    the Retry-After Riot sends has passed.
+    """
+
+    def __init__(self, pool_size=None, timeout=None, limiter=None):
+        self.pool_size = pool_size or int(os.environ.get('RIOT_POOL_SIZE', 10))
+        self.timeout = timeout or float(os.environ.get('RIOT_READ_TIMEOUT', 10))
+        self.max_retries = int(os.environ.get('RIOT_MAX_RETRIES', 3))
+        self.limiter = limiter or ratelimit.RateLimiter(
+            share=float(os.environ.get('INGEST_RATE_SHARE', 0.5)))
+        self.local = threading.local()
+
+    def session(self):
+        """
+        Returns this thread's session; requests sessions are not thread-safe
+        """
+        if not hasattr(self.local, 'session'):
+            adapter = HTTPAdapter(pool_maxsize=self.pool_size)
+            self.local.session = requests.Session()
+            self.local.session.mount('https://', adapter)
+            self.local.session.mount('http://', adapter)
+        return self.local.session
+
+    def get(self, url, apikey, method):
+        """
+        Returns the decoded JSON at url, or None for a 404. Raises RiotError
+        for anything else that is not a success. method names the Riot API
+        method (e.g. 'tft-match-v1.match') whose limits apply.
+        """
+        host = urlsplit(url).netloc.lower()
+        key = key_id(apikey)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(host, method, key)
+            response = self.session().get(
+                url, headers={'X-Riot-Token': apikey}, timeout=self.timeout)
+            self.limiter.update(host, method, response, key)
+            if response.status_code != 429:
+                break
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RiotError(f"{response.status_code} from {url.split('?')[0]}")
+        return response.json()
+
+def key_id(apikey):
+    """
+    Same digest the front end uses to tell API keys apart
+    """
+    return hashlib.sha256(apikey.encode()).hexdigest()[:16]
+
+def host(region):
+    """
+    Returns the base URL for a platform ('na1') or routing value
+    ('americas'). RIOT_BASE_URL points every region at another server, such
+    as the fake in bench/fakeriot.py.
+    """
+    base_url = os.environ.get('RIOT_BASE_URL')
+    if base_url:
+        return base_url.rstrip('/') + '/' + region.lower()
+    return 'https://' + region.lower() + '.api.riotgames.com'
+
+def routing(region):
+    """
+    Returns the routing value serving a platform's matches
+    """
+    return ROUTING.get(region.lower(), 'americas')
+
+# Shared by every ingest thread in the process
+client = RiotClient()
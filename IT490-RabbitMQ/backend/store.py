@@ -0,0 +1,213 @@
+import json
+import logging
+
+import db
+
+# Seconds stored data may be used for when the caller does not say
+DEFAULT_MAX_AGE = 3600
+
+def summoner_row(row):
+    """
+    Turns a summoners row back into Riot's summoner JSON
+    """
+    return {
+        'id': row[0],
+        'accountId': row[1],
+        'puuid': row[2],
+        'name': row[3],
+        'profileIconId': row[4],
+        'revisionDate': row[5],
+        'summonerLevel': row[6],
+    }
+
+def get_summoner(curr, data):
+    """
+    Looks a summoner up by puuid, or by region and name for the caller's
+    API key, if stored within maxAge seconds
+    """
+    max_age = data.get('maxAge', DEFAULT_MAX_AGE)
+    if 'puuid' in data:
+        db.execute(curr, 'get_summoner_by_puuid', (data['puuid'], max_age))
+    else:
+        db.execute(curr, 'get_summoner_by_name',
+                   (data['region'].lower(), data['name'], data['keyId'], max_age))
+    row = curr.fetchone()
+    if row == None:
+        return {'success': False}
+    return {'success': True, 'summoner': summoner_row(row)}
+
+def put_summoner(curr, data):
+    """
+    Saves or refreshes a summoner from Riot's summoner JSON
+    """
+    summoner = data['summoner']
+    db.execute(curr, 'put_summoner', (
+        summoner['puuid'], data['keyId'], data['region'].lower(), summoner['id'],
+        summoner['accountId'], summoner['name'], summoner['profileIconId'],
+        summoner['revisionDate'], summoner['summonerLevel']))
+    return {'success': True}
+
+def get_league(curr, data):
+    """
+    Returns a summoner's stored ranked entries for a game ('League' or
+    'TFT') if saved within maxAge seconds. Unranked summoners have no rows
+    and so always miss.
+    """
+    db.execute(curr, 'get_league',
+               (data['summonerId'], data['game'], data.get('maxAge', DEFAULT_MAX_AGE)))
+    rows = curr.fetchall()
+    if not rows:
+        return {'success': False}
+    fields = ('queueType', 'tier', 'rank', 'leaguePoints', 'wins', 'losses')
+    # Fields the entry did not have are left out, as Riot does
+    return {'success': True, 'entries': [
+        {field: value for field, value in zip(fields, row) if value is not None}
+        for row in rows]}
+
+def put_league(curr, data):
+    """
+    Replaces a summoner's ranked entries for a game, keeping Riot's order.
+    Only queueType is required; Hyper Roll entries have no tier, rank or LP.
+    """
+    db.execute(curr, 'delete_league', (data['summonerId'], data['game']))
+    for position, entry in enumerate(data['entries']):
+        db.execute(curr, 'put_league_entry', (
+            data['summonerId'], data['game'], position, entry['queueType'],
+            entry.get('tier'), entry.get('rank'), entry.get('leaguePoints'),
+            entry.get('wins'), entry.get('losses')))
+    return {'success': True}
+
+def get_tft_match(curr, data):
+    """
+    Rebuilds a TFT match stored for the caller's API key in the shape of
+    Riot's match JSON, with participants in placement order
+    """
+    match_id = data['matchId']
+    db.execute(curr, 'get_tft_match', (match_id, data['keyId']))
+    row = curr.fetchone()
+    if row == None:
+        return {'success': False}
+    db.execute(curr, 'get_tft_participants', (match_id, data['keyId']))
+    participants = [{'puuid': puuid, 'placement': placement, 'level': level, 'units': []}
+                    for puuid, placement, level in curr.fetchall()]
+    by_puuid = {participant['puuid']: participant for participant in participants}
+    db.execute(curr, 'get_tft_units', (match_id, data['keyId']))
+    for puuid, character_id, tier, rarity in curr.fetchall():
+        by_puuid[puuid]['units'].append(
+            {'character_id': character_id, 'tier': tier, 'rarity': rarity})
+    return {'success': True, 'match': {
+        'metadata': {
+            'match_id': match_id,
+            'participants': [participant['puuid'] for participant in participants],
+        },
+        'info': {
+            'game_datetime': row[0],
+            'game_length': row[1],
+            'game_version': row[2],
+            'queue_id': row[3],
+            'tft_set_number': row[4],
+            'participants': participants,
+        }}}
+
+def put_tft_match(curr, data):
+    """
+    Saves a TFT match from Riot's match JSON and adds it to each
+    participant's running stats. Matches never change, so one the key has
+    already stored is left alone and never counted twice. Returns whether
+    it was new.
+    """
+    match = data['match']
+    match_id = match['metadata']['match_id']
+    key_id = data['keyId']
+    info = match['info']
+    db.execute(curr, 'put_tft_match', (
+        match_id, key_id, info['game_datetime'], info['game_length'],
+        info['game_version'], info['queue_id'], info['tft_set_number']))
+    if curr.fetchone() == None:
+        return {'success': True, 'new': False}
+    for participant in info['participants']:
+        db.execute(curr, 'put_tft_participant', (
+            match_id, key_id, participant['puuid'], participant['placement'], participant['level']))
+        for slot, unit in enumerate(participant['units']):
+            db.execute(curr, 'put_tft_unit', (
+                match_id, key_id, participant['puuid'], slot, unit['character_id'],
+                unit['tier'], unit.get('rarity', 0)))
+        # Keys of the same Riot application see the same puuids, so players
+        # already counted through another key's copy are not counted again.
+        # Claiming the row first makes a concurrent copy wait and then skip.
+        db.execute(curr, 'count_tft_participant', (match_id, participant['puuid']))
+        if curr.fetchone() == None:
+            continue
+        db.execute(curr, 'add_tft_player_game',
+                   (participant['puuid'], participant['placement'], participant['level']))
+        # Two copies of a unit on one board still count as one game
+        for character_id, tier in {(unit['character_id'], unit['tier'])
+                                   for unit in participant['units']}:
+            db.execute(curr, 'add_tft_player_unit', (participant['puuid'], character_id, tier))
+    logging.info(f"Stored TFT match {match_id}")
+    return {'success': True, 'new': True}
+
+def get_tft_match_ids(curr, data):
+    """
+    Returns a page of a player's stored TFT match IDs, newest first, if the
+    ingest worker has caught up on the player within maxAge seconds
+    """
+    db.execute(curr, 'get_ingest_state',
+               (data['puuid'], 'TFT', data.get('maxAge', DEFAULT_MAX_AGE)))
+    row = curr.fetchone()
+    if row == None or not row[1]:
+        return {'success': False}
+    db.execute(curr, 'get_tft_match_ids',
+               (data['puuid'], data['keyId'], data.get('start', 0), data.get('count', 20)))
+    return {'success': True, 'matchIds': [row[0] for row in curr.fetchall()]}
+
+def get_tft_stats(curr, data):
+    """
+    Returns a player's running TFT stats and their `units` (default 5) most
+    played units by star tier, without touching their matches
+    """
+    db.execute(curr, 'get_tft_player_stats', (data['puuid'],))
+    row = curr.fetchone()
+    if row == None:
+        return {'success': False}
+    games, top4, placement_sum, level_sum, placements = row
+    db.execute(curr, 'get_tft_player_units', (data['puuid'], data.get('units', 5)))
+    return {'success': True, 'stats': {
+        'games': games,
+        'top4Rate': top4 / games,
+        'averagePlacement': placement_sum / games,
+        'averageLevel': level_sum / games,
+        'placements': placements,
+        'units': [{'character_id': character_id, 'tier': tier, 'games': unit_games}
+                  for character_id, tier, unit_games in curr.fetchall()],
+    }}
+
+def put_lol_match(curr, data):
+    """
+    Saves a League match from Riot's match-v5 JSON. Like TFT matches, one
+    the key has already stored is left alone. Returns whether it was new.
+    """
+    match = data['match']
+    match_id = match['metadata']['matchId']
+    info = match['info']
+    db.execute(curr, 'put_lol_match', (
+        match_id, data['keyId'], info['gameCreation'], info['gameDuration'],
+        info['queueId'], json.dumps(match)))
+    if curr.fetchone() == None:
+        return {'success': True, 'new': False}
+    for puuid in match['metadata']['participants']:
+        db.execute(curr, 'put_lol_match_player', (match_id, data['keyId'], puuid))
+    logging.info(f"Stored League match {match_id}")
+    return {'success': True, 'new': True}
+
+# RPC actions served from the store
+ACTIONS = {
+    'GETSUMMONER': get_summoner,
+    'PUTSUMMONER': put_summoner,
+    'GETLEAGUE': get_league,
+    'PUTLEAGUE': put_league,
+    'GETTFTMATCH': get_tft_match,
+    'PUTTFTMATCH': put_tft_match,
+    'GETTFTMATCHIDS': get_tft_match_ids,
+    'GETTFTSTATS': get_tft_stats,
+}
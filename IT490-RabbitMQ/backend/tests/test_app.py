@@ -0,0 +1,202 @@
+import json
+from concurrent.futures import Future
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pika
+import psycopg2
+import pytest
+
+import app
+
+class Stopping:
+    """
+    Stands in for the shared multiprocessing.Event without waiting
+    """
+
+    def __init__(self):
+        self.stopped = False
+        self.waits = []
+
+    def is_set(self):
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        return self.stopped
+
+class FakeChannel:
+    def __init__(self):
+        self.calls = []
+
+    def queue_declare(self, queue):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.deliver = on_message_callback
+        return 'consumer-1'
+
+    def basic_cancel(self, consumer_tag):
+        self.calls.append(('cancel', consumer_tag))
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.calls.append(('publish', routing_key, properties.correlation_id, json.loads(body)))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.calls.append(('ack', delivery_tag, multiple))
+
+class FakeConnection:
+    """
+    Delivers messages on the first process_data_events, then asks the
+    consumer to stop
+    """
+
+    def __init__(self, stopping, messages):
+        self.stopping = stopping
+        self.messages = messages
+        self.fake_channel = FakeChannel()
+        self.closed = False
+
+    def channel(self):
+        return self.fake_channel
+
+    def process_data_events(self, time_limit=None):
+        for tag, body in self.messages:
+            properties = SimpleNamespace(reply_to='replies', correlation_id=f'c{tag}')
+            self.fake_channel.deliver(self.fake_channel, SimpleNamespace(delivery_tag=tag),
+                                      properties, body)
+        self.messages = []
+        self.stopping.set()
+
+    def close(self):
+        self.closed = True
+
+def test_shutdown_cancels_consumer_and_flushes(monkeypatch):
+    stopping = Stopping()
+    connection = FakeConnection(stopping, [(1, b'{"action": "A"}'), (2, b'not json')])
+    monkeypatch.setattr(app, 'connect_messaging', lambda: connection)
+    monkeypatch.setattr(app, 'BATCH_SIZE', 10)
+    monkeypatch.setattr(app, 'execute', lambda pool, requests: [{'request': r} for r in requests])
+    app.consume(None, stopping)
+    assert connection.fake_channel.calls == [
+        ('cancel', 'consumer-1'),
+        ('publish', 'replies', 'c1', {'request': {'action': 'A'}}),
+        ('publish', 'replies', 'c2', {'request': {}}),
+        ('ack', 2, True),
+    ]
+    assert connection.closed
+
+def test_serve_reconnects_after_losing_messaging(monkeypatch):
+    stopping = Stopping()
+    attempts = []
+    def consume(pool, stopping, queue):
+        attempts.append(queue)
+        if len(attempts) < 3:
+            raise pika.exceptions.StreamLostError("broker restarted")
+        stopping.set()
+    monkeypatch.setattr(app, 'consume', consume)
+    app.serve(None, stopping, 'store')
+    assert attempts == ['store'] * 3
+    assert stopping.waits == [1, 2]
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, args=None):
+        self.log.append(sql)
+
+class FakePool:
+    """
+    Hands out connections that log SQL and commits to one list
+    """
+
+    def __init__(self):
+        self.log = []
+        self.connections = 0
+
+    @contextmanager
+    def connection(self):
+        self.connections += 1
+        yield SimpleNamespace(cursor=lambda: FakeCursor(self.log),
+                              commit=lambda: self.log.append('COMMIT'))
+
+@pytest.fixture
+def pool(monkeypatch):
+    """
+    A pool whose requests are {'reply': ...}, {'raise': exception},
+    {'raise_once': [exception]} or {'future': future}
+    """
+    def handle_request(curr, request):
+        curr.execute(f"request {request.get('reply')}")
+        if 'raise' in request:
+            raise request['raise']
+        if request.get('raise_once'):
+            raise request['raise_once'].pop()
+        if 'future' in request:
+            return request['future']
+        return {'reply': request.get('reply')}
+    monkeypatch.setattr(app, 'handle_request', handle_request)
+    return FakePool()
+
+def failed(message):
+    return {'success': False, 'message': message}
+
+def test_single_request_runs_without_savepoint(pool):
+    assert app.execute(pool, [{'reply': 1}]) == [{'reply': 1}]
+    assert pool.log == ['request 1', 'COMMIT']
+
+def test_batch_runs_each_request_under_savepoint(pool):
+    assert app.execute(pool, [{'reply': 1}, {'reply': 2}]) == [{'reply': 1}, {'reply': 2}]
+    assert pool.log == ['SAVEPOINT request;', 'request 1', 'RELEASE SAVEPOINT request;',
+                        'SAVEPOINT request;', 'request 2', 'RELEASE SAVEPOINT request;',
+                        'COMMIT']
+
+@pytest.mark.parametrize('error, message', [
+    (psycopg2.IntegrityError(), "Database error"),
+    (KeyError('data'), "Request failed"),
+])
+def test_failing_request_only_undoes_itself(pool, error, message):
+    responses = app.execute(pool, [{'reply': 1}, {'reply': 2, 'raise': error}, {'reply': 3}])
+    assert responses == [{'reply': 1}, failed(message), {'reply': 3}]
+    assert pool.log == ['SAVEPOINT request;', 'request 1', 'RELEASE SAVEPOINT request;',
+                        'SAVEPOINT request;', 'request 2', 'ROLLBACK TO SAVEPOINT request;',
+                        'SAVEPOINT request;', 'request 3', 'RELEASE SAVEPOINT request;',
+                        'COMMIT']
+
+def test_failing_single_request_is_answered(pool):
+    assert app.execute(pool, [{'raise': KeyError('data')}]) == [failed("Request failed")]
+    assert 'COMMIT' not in pool.log
+
+def test_lost_connection_retries_batch_on_new_connection(pool):
+    requests = [{'reply': 1, 'raise_once': [psycopg2.OperationalError()]}, {'reply': 2}]
+    assert app.execute(pool, requests) == [{'reply': 1}, {'reply': 2}]
+    assert pool.connections == 2
+    assert pool.log.count('COMMIT') == 1
+
+def test_lost_connection_twice_fails_batch(pool):
+    requests = [{'reply': 1, 'raise': psycopg2.OperationalError()}, {'reply': 2}]
+    assert app.execute(pool, requests) == [failed("Database error")] * 2
+    assert pool.connections == 2
+    assert 'COMMIT' not in pool.log
+
+def test_future_results_are_resolved_after_commit(pool):
+    done = Future()
+    done.set_result({'success': True})
+    broken = Future()
+    broken.set_exception(ValueError("bad hash"))
+    responses = app.execute(pool, [{'future': done}, {'future': broken}, {'reply': 3}])
+    assert responses == [{'success': True}, failed("Request failed"), {'reply': 3}]
+    assert pool.log[-1] == 'COMMIT'
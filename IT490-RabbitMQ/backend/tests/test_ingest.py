@@ -0,0 +1,163 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import ingest
+import riot
+
+class Stopping:
+    def __init__(self):
+        self.stopped = False
+
+    def is_set(self):
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+class FakeChannel:
+    def __init__(self):
+        self.calls = []
+
+    def queue_declare(self, queue, arguments=None):
+        self.calls.append(('declare', queue, arguments))
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.deliver = on_message_callback
+        return 'consumer-1'
+
+    def basic_cancel(self, consumer_tag):
+        pass
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.calls.append(('publish', routing_key, properties.headers, body))
+
+    def basic_ack(self, delivery_tag):
+        self.calls.append(('ack', delivery_tag))
+
+class FakeConnection:
+    """
+    Delivers (headers, body) messages on the first process_data_events,
+    then asks the consumer to stop
+    """
+
+    def __init__(self, stopping, messages):
+        self.stopping = stopping
+        self.messages = messages
+        self.fake_channel = FakeChannel()
+
+    def channel(self):
+        return self.fake_channel
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def process_data_events(self, time_limit=None):
+        for tag, (headers, body) in enumerate(self.messages):
+            self.fake_channel.deliver(self.fake_channel, SimpleNamespace(delivery_tag=tag),
+                                      SimpleNamespace(headers=headers), body)
+        self.messages = []
+        self.stopping.set()
+
+    def close(self):
+        pass
+
+def consume(monkeypatch, messages, fail=True):
+    def run(pool, request):
+        if fail:
+            raise riot.RiotError("503")
+    monkeypatch.setattr(ingest, 'ingest', run)
+    stopping = Stopping()
+    connection = FakeConnection(stopping, messages)
+    ingest.consume(None, connection, stopping)
+    return [call for call in connection.fake_channel.calls if call[0] != 'declare']
+
+def test_retry_queue_dead_letters_back_to_ingest(monkeypatch):
+    connection = FakeConnection(Stopping(), [])
+    connection.stopping.set()
+    ingest.consume(None, connection, connection.stopping)
+    assert ('declare', 'ingest.retry', {
+        'x-message-ttl': int(ingest.RETRY_DELAY * 1000),
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': 'ingest',
+    }) in connection.fake_channel.calls
+
+def test_success_is_acked(monkeypatch):
+    assert consume(monkeypatch, [(None, b'{}')], fail=False) == [('ack', 0)]
+
+def test_failure_is_retried_with_count(monkeypatch):
+    calls = consume(monkeypatch, [(None, b'{}'), ({'x-retries': 1}, b'{}')])
+    assert calls == [('publish', 'ingest.retry', {'x-retries': 1}, b'{}'), ('ack', 0),
+                     ('publish', 'ingest.retry', {'x-retries': 2}, b'{}'), ('ack', 1)]
+
+def test_failure_is_dropped_after_max_retries(monkeypatch):
+    calls = consume(monkeypatch, [({'x-retries': ingest.MAX_RETRIES}, b'{}')])
+    assert calls == [('ack', 0)]
+
+def test_message_that_is_not_json_is_retried_then_dropped(monkeypatch):
+    calls = consume(monkeypatch, [(None, b'not json')], fail=False)
+    assert calls[0][:3] == ('publish', 'ingest.retry', {'x-retries': 1})
+
+class RecordingLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self, host, method, key=None):
+        self.calls.append(('acquire', host, method, key))
+
+    def update(self, host, method, response, key=None):
+        self.calls.append(('update', host, method, key, response.status_code))
+
+def test_riot_calls_are_paced_per_key(monkeypatch):
+    responses = iter([SimpleNamespace(status_code=429, headers={'Retry-After': '1'}),
+                      SimpleNamespace(status_code=200, headers={}, json=lambda: ['NA1_1'])])
+    limiter = RecordingLimiter()
+    client = riot.RiotClient(limiter=limiter)
+    monkeypatch.setattr(client, 'session', lambda: SimpleNamespace(
+        get=lambda url, headers, timeout: next(responses)))
+    url = 'https://americas.api.riotgames.com/tft/match/v1/matches/by-puuid/p/ids'
+    assert client.get(url, 'RGAPI-key', 'tft-match-v1.ids-by-puuid') == ['NA1_1']
+    key = riot.key_id('RGAPI-key')
+    host = 'americas.api.riotgames.com'
+    assert limiter.calls == [
+        ('acquire', host, 'tft-match-v1.ids-by-puuid', key),
+        ('update', host, 'tft-match-v1.ids-by-puuid', key, 429),
+        ('acquire', host, 'tft-match-v1.ids-by-puuid', key),
+        ('update', host, 'tft-match-v1.ids-by-puuid', key, 200),
+    ]
+
+def test_ingest_keeps_to_a_share_of_each_limit():
+    assert riot.RiotClient().limiter.share == float(os.environ.get('INGEST_RATE_SHARE', 0.5))
+
+def test_new_match_ids_stop_at_last_ingested_and_max(monkeypatch):
+    ids = ['m5', 'm4', 'm3', 'm2', 'm1']
+    calls = []
+    def get(url, apikey, method):
+        query = dict(part.split('=') for part in url.split('?')[1].split('&'))
+        start, count = int(query['start']), int(query['count'])
+        calls.append((start, count, method))
+        return ids[start:start + count]
+    monkeypatch.setattr(ingest.riot.client, 'get', get)
+    monkeypatch.setattr(ingest, 'PAGE_SIZE', 3)
+    monkeypatch.setattr(ingest, 'MAX_MATCHES', 10)
+    assert ingest.new_match_ids('', '/{}/ids', 'ids', 'p', 'k', 'm2') == ['m5', 'm4', 'm3']
+    calls.clear()
+    monkeypatch.setattr(ingest, 'MAX_MATCHES', 4)
+    assert ingest.new_match_ids('', '/{}/ids', 'ids', 'p', 'k', None) == ['m5', 'm4', 'm3', 'm2']
+    assert calls == [(0, 3, 'ids'), (3, 1, 'ids')]
+
+def test_ratelimit_matches_front_end():
+    """
+    backend/ratelimit.py is a copy, as each container builds from its own
+    directory
+    """
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    front_end = os.path.join(here, '..', 'front-end', 'ratelimit.py')
+    if not os.path.exists(front_end):
+        pytest.skip("front-end not checked out alongside")
+    with open(front_end) as theirs, open(os.path.join(here, 'ratelimit.py')) as ours:
+        assert ours.read() == theirs.read()
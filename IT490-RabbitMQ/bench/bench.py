@@ -0,0 +1,117 @@
+"""
+Measures /league and /tft latency percentiles and throughput against the
+fake Riot API in fakeriot.py.
+
+By default the front end is loaded in-process and driven through Flask's
+test client, with a fake server started on a free port:
+
+    python bench.py --requests 500 --concurrency 16 --latency 40
+
+To benchmark a running front end instead, start fakeriot.py, run the front
+end with RIOT_BASE_URL/DDRAGON_BASE_URL pointing at it and pass --target:
+
+    python bench.py --target http://localhost:5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import fakeriot
+
+FRONT_END = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'front-end')
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def in_process_client(fake_url):
+    """
+    Imports the front end pointed at the fake server and returns a function
+    that POSTs a form through a per-thread Flask test client
+    """
+    os.environ['RIOT_BASE_URL'] = fake_url
+    os.environ['DDRAGON_BASE_URL'] = fake_url + '/ddragon'
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('RABBITMQ_DEFAULT_USER', 'bench')
+    os.environ.setdefault('RABBITMQ_DEFAULT_PASS', 'bench')
+    sys.path.insert(0, FRONT_END)
+    import app
+    local = threading.local()
+
+    def post(path, form):
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        response = local.client.post(path, data=form)
+        # Streamed pages only do their work as the body is read
+        response.get_data()
+        return response.status_code
+    return post
+
+def http_client(target):
+    """
+    Returns a function that POSTs a form to a running front end
+    """
+    import requests
+    local = threading.local()
+
+    def post(path, form):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session.post(target + path, data=form).status_code
+    return post
+
+def run(post, path, requests, concurrency, players, matches=10):
+    """
+    Sends `requests` lookups spread over `players` summoner names and
+    returns (latencies, status counts, wall time). matches is the number of
+    games asked for by /tft/history.
+    """
+    def one(i):
+        form = {'region': 'NA1', 'player': 'player%d' % (i % players), 'apikey': 'bench-key',
+                'count': matches}
+        start = time.perf_counter()
+        try:
+            status = post(path, form)
+        except Exception as error:
+            status = type(error).__name__
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    return [r[0] for r in results], Counter(r[1] for r in results), time.perf_counter() - start
+
+def report(path, latencies, statuses, wall):
+    ms = [latency * 1000 for latency in latencies]
+    print(f"{path}: {len(ms)} requests in {wall:.2f}s, {len(ms) / wall:.1f} req/s")
+    print(f"  p50 {percentile(ms, 0.5):.1f}ms  p90 {percentile(ms, 0.9):.1f}ms  "
+          f"p99 {percentile(ms, 0.99):.1f}ms  max {max(ms):.1f}ms  mean {statistics.mean(ms):.1f}ms")
+    print(f"  status {dict(statuses)}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark /league and /tft")
+    parser.add_argument('--paths', nargs='+', default=['/league', '/tft'])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--players', type=int, default=50, help="distinct summoner names to look up")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--matches', type=int, default=10, help="games per /tft/history lookup")
+    parser.add_argument('--target', help="URL of a running front end; skips the in-process fake")
+    fakeriot.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.target:
+        post = http_client(args.target.rstrip('/'))
+    else:
+        server = fakeriot.from_arguments(args).server(0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        post = in_process_client('http://127.0.0.1:%d' % server.server_address[1])
+
+    for path in args.paths:
+        run(post, path, args.warmup, args.concurrency, args.players, args.matches)
+        report(path, *run(post, path, args.requests, args.concurrency, args.players, args.matches))
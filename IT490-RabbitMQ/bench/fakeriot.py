@@ -0,0 +1,165 @@
+"""
+Local stand-in for the Riot API and Data Dragon, serving the recorded
+responses in fixtures/. Point the front end at it with
+
+    RIOT_BASE_URL=http://localhost:8000
+    DDRAGON_BASE_URL=http://localhost:8000/ddragon
+
+Run it on its own with: python fakeriot.py --latency 40 --rate-429 0.01
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+NOT_FOUND = {'status': {'message': 'Data not found', 'status_code': 404}}
+RATE_LIMITED = {'status': {'message': 'Rate limit exceeded', 'status_code': 429}}
+
+def load(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+class FakeRiot:
+    """
+    Routes Riot and Data Dragon paths to fixtures, with configurable
+    latency and injected 429/404 responses
+    """
+
+    def __init__(self, latency=0, jitter=0, rate_429=0, rate_404=0,
+                 spectate_rate=0.5, retry_after=1, app_limit='100000:1'):
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.rate_429 = rate_429
+        self.rate_404 = rate_404
+        self.spectate_rate = spectate_rate
+        self.retry_after = retry_after
+        self.app_limit = app_limit
+        self.fixtures = {name: load(name) for name in os.listdir(FIXTURES)}
+        self.routes = [
+            (r'/[^/]+/lol/summoner/v4/summoners/by-name/(?P<name>[^/]+)', self.summoner_by_name),
+            (r'/[^/]+/tft/summoner/v1/summoners/by-puuid/(?P<puuid>[^/]+)', self.summoner_by_puuid),
+            (r'/[^/]+/lol/league/v4/entries/by-summoner/(?P<id>[^/]+)', self.fixture('league.json')),
+            (r'/[^/]+/tft/league/v1/entries/by-summoner/(?P<id>[^/]+)', self.fixture('tftleague.json')),
+            (r'/[^/]+/lol/spectator/v4/active-games/by-summoner/(?P<id>[^/]+)', self.spectator),
+            (r'/[^/]+/tft/match/v1/matches/by-puuid/(?P<puuid>[^/]+)/ids', self.match_ids),
+            (r'/[^/]+/tft/match/v1/matches/(?P<match>[^/]+)', self.tft_match),
+            (r'/[^/]+/lol/match/v5/matches/by-puuid/(?P<puuid>[^/]+)/ids', self.match_ids),
+            (r'/[^/]+/lol/match/v5/matches/(?P<match>[^/]+)', self.lol_match),
+            (r'/ddragon/api/versions.json', self.fixture('versions.json')),
+            (r'/ddragon/cdn/[^/]+/data/en_US/champion.json', self.fixture('champion.json')),
+        ]
+
+    def fixture(self, name):
+        return lambda **params: (200, self.fixtures[name])
+
+    def match_ids(self, puuid, start='0', count='20', **query):
+        # Counts down from the recorded match ID, one page at a time
+        newest = json.loads(self.fixtures['matchids.json'])[0]
+        prefix, number = newest.rsplit('_', 1)
+        return 200, json.dumps(['%s_%d' % (prefix, int(number) - i)
+                                for i in range(int(start), int(start) + int(count))])
+
+    def tft_match(self, match, **query):
+        newest = json.loads(self.fixtures['matchids.json'])[0]
+        return 200, self.fixtures['tftmatch.json'].replace(newest, match)
+
+    def lol_match(self, match, **query):
+        newest = json.loads(self.fixtures['matchids.json'])[0]
+        return 200, self.fixtures['lolmatch.json'].replace(newest, match)
+
+    def summoner(self, name, puuid):
+        body = self.fixtures['summoner.json']
+        body = body.replace('ENCRYPTED_SUMMONER_ID', 'id-' + name)
+        body = body.replace('ENCRYPTED_ACCOUNT_ID', 'account-' + name)
+        body = body.replace('ENCRYPTED_PUUID', puuid)
+        return 200, body.replace('SUMMONER_NAME', name)
+
+    def summoner_by_name(self, name, **query):
+        if name.lower().startswith('missing') or random.random() < self.rate_404:
+            return 404, json.dumps(NOT_FOUND)
+        return self.summoner(name, 'puuid-' + name)
+
+    def summoner_by_puuid(self, puuid, **query):
+        return self.summoner('Player ' + puuid[-4:], puuid)
+
+    def spectator(self, id, **query):
+        # Whether a summoner is in game is stable per summoner
+        bucket = int(hashlib.md5(id.encode()).hexdigest(), 16) % 1000
+        if bucket >= self.spectate_rate * 1000:
+            return 404, json.dumps(NOT_FOUND)
+        return 200, self.fixtures['spectator.json']
+
+    def handle(self, path, query=None):
+        """
+        Returns (status, headers, body) for a request path and its query
+        parameters
+        """
+        time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        headers = {
+            'Content-Type': 'application/json;charset=utf-8',
+            'X-App-Rate-Limit': self.app_limit,
+        }
+        if not path.startswith('/ddragon/') and random.random() < self.rate_429:
+            headers['Retry-After'] = str(self.retry_after)
+            headers['X-Rate-Limit-Type'] = 'application'
+            return 429, headers, json.dumps(RATE_LIMITED)
+        for pattern, route in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                status, body = route(**match.groupdict(), **(query or {}))
+                return status, headers, body
+        return 404, headers, json.dumps(NOT_FOUND)
+
+    def server(self, port=8000):
+        """
+        Returns a threaded HTTP server for this fake, not yet started
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, headers, body = fake.handle(unquote(url.path), dict(parse_qsl(url.query)))
+                body = body.encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer(('127.0.0.1', port), Handler)
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0, help="mean response delay in ms")
+    parser.add_argument('--jitter', type=float, default=0, help="+/- ms added to the delay")
+    parser.add_argument('--rate-429', type=float, default=0, help="fraction of Riot calls answered with 429")
+    parser.add_argument('--rate-404', type=float, default=0, help="fraction of summoner lookups answered with 404")
+    parser.add_argument('--spectate-rate', type=float, default=0.5, help="fraction of summoners currently in game")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with a 429")
+
+def from_arguments(args):
+    return FakeRiot(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                    rate_404=args.rate_404, spectate_rate=args.spectate_rate,
+                    retry_after=args.retry_after)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Riot API server")
+    parser.add_argument('--port', type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = from_arguments(args).server(args.port)
+    print(f"Fake Riot API listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -4,3 +4,128 @@ CREATE TABLE users(
     email VARCHAR(255) PRIMARY KEY,
     hash VARCHAR(255) NOT NULL
 );
+
+-- Riot data we have already fetched, so repeat lookups can skip Riot.
+-- Summoner IDs and puuids are encrypted per API key, so rows also record a
+-- digest of the key they were fetched with.
+CREATE TABLE summoners(
+    puuid VARCHAR(78) PRIMARY KEY,
+    key_id VARCHAR(16) NOT NULL,
+    region VARCHAR(8) NOT NULL,
+    summoner_id VARCHAR(63) NOT NULL,
+    account_id VARCHAR(56) NOT NULL,
+    name VARCHAR(32) NOT NULL,
+    profile_icon_id INTEGER NOT NULL,
+    revision_date BIGINT NOT NULL,
+    summoner_level INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX summoners_by_name ON summoners(region, lower(name), key_id);
+
+-- Hyper Roll entries (RANKED_TFT_TURBO) have no tier, rank or LP
+CREATE TABLE league_entries(
+    summoner_id VARCHAR(63) NOT NULL,
+    game VARCHAR(8) NOT NULL,
+    position SMALLINT NOT NULL,
+    queue_type VARCHAR(32) NOT NULL,
+    tier VARCHAR(16),
+    rank VARCHAR(4),
+    league_points INTEGER,
+    wins INTEGER,
+    losses INTEGER,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (summoner_id, game, position)
+);
+
+-- Match JSON lists participants by puuid, so a match is stored once per key
+-- and only served back to lookups made with that key.
+CREATE TABLE tft_matches(
+    match_id VARCHAR(32) NOT NULL,
+    key_id VARCHAR(16) NOT NULL,
+    game_datetime BIGINT NOT NULL,
+    game_length REAL NOT NULL,
+    game_version VARCHAR(64) NOT NULL,
+    queue_id INTEGER NOT NULL,
+    tft_set_number INTEGER NOT NULL,
+    PRIMARY KEY (match_id, key_id)
+);
+
+CREATE TABLE tft_participants(
+    match_id VARCHAR(32) NOT NULL,
+    key_id VARCHAR(16) NOT NULL,
+    puuid VARCHAR(78) NOT NULL,
+    placement SMALLINT NOT NULL,
+    level SMALLINT NOT NULL,
+    PRIMARY KEY (match_id, key_id, puuid),
+    FOREIGN KEY (match_id, key_id) REFERENCES tft_matches ON DELETE CASCADE
+);
+CREATE INDEX tft_participants_by_puuid ON tft_participants(puuid);
+
+CREATE TABLE tft_units(
+    match_id VARCHAR(32) NOT NULL,
+    key_id VARCHAR(16) NOT NULL,
+    puuid VARCHAR(78) NOT NULL,
+    slot SMALLINT NOT NULL,
+    character_id VARCHAR(64) NOT NULL,
+    tier SMALLINT NOT NULL,
+    rarity SMALLINT NOT NULL,
+    PRIMARY KEY (match_id, key_id, puuid, slot),
+    FOREIGN KEY (match_id, key_id, puuid) REFERENCES tft_participants ON DELETE CASCADE
+);
+
+-- League matches are kept whole; only the players are broken out so a
+-- player's matches can be found.
+CREATE TABLE lol_matches(
+    match_id VARCHAR(32) NOT NULL,
+    key_id VARCHAR(16) NOT NULL,
+    game_creation BIGINT NOT NULL,
+    game_duration INTEGER NOT NULL,
+    queue_id INTEGER NOT NULL,
+    body JSONB NOT NULL,
+    PRIMARY KEY (match_id, key_id)
+);
+
+CREATE TABLE lol_match_players(
+    match_id VARCHAR(32) NOT NULL,
+    key_id VARCHAR(16) NOT NULL,
+    puuid VARCHAR(78) NOT NULL,
+    PRIMARY KEY (match_id, key_id, puuid),
+    FOREIGN KEY (match_id, key_id) REFERENCES lol_matches ON DELETE CASCADE
+);
+CREATE INDEX lol_match_players_by_puuid ON lol_match_players(puuid);
+
+-- Newest match the ingest worker has stored for each player and game
+CREATE TABLE ingest_state(
+    puuid VARCHAR(78) NOT NULL,
+    game VARCHAR(8) NOT NULL,
+    last_match_id VARCHAR(32) NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (puuid, game)
+);
+
+-- Running TFT totals per player, bumped as each new match is stored so a
+-- profile is read in one lookup. placements[n] counts games finished nth.
+CREATE TABLE tft_player_stats(
+    puuid VARCHAR(78) PRIMARY KEY,
+    games INTEGER NOT NULL,
+    top4 INTEGER NOT NULL,
+    placement_sum INTEGER NOT NULL,
+    level_sum INTEGER NOT NULL,
+    placements INTEGER[] NOT NULL
+);
+
+-- Players whose stats already include a match, whichever key stored it
+CREATE TABLE tft_counted(
+    match_id VARCHAR(32) NOT NULL,
+    puuid VARCHAR(78) NOT NULL,
+    PRIMARY KEY (match_id, puuid)
+);
+
+-- Games in which a player fielded a unit at a star tier
+CREATE TABLE tft_player_units(
+    puuid VARCHAR(78) NOT NULL,
+    character_id VARCHAR(64) NOT NULL,
+    tier SMALLINT NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (puuid, character_id, tier)
+);
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+import riot
+
+class AsyncRiotClient:
+    """
+    asyncio counterpart of riot.RiotClient. Flask runs every async view in
+    a fresh event loop, so the HTTP connection pool lives on one long-lived
+    loop in a background thread and get() hands calls over to it. That way
+    keep-alive connections survive between requests. Rate limits are shared
+    with the synchronous client.
+    """
+
+    def __init__(self, limiter=None, pool_size=None):
+        self.limiter = limiter or riot.client.limiter
+        self.max_retries = riot.client.max_retries
+        self.pool_size = pool_size or int(os.environ.get('RIOT_ASYNC_POOL_SIZE', 50))
+        self.timeout = httpx.Timeout(riot.client.timeout[1], connect=riot.client.timeout[0])
+        self.loop = None
+        self.http = None
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the background event loop on first use
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def get(self, url, method=None):
+        """
+        Sends a GET from any event loop and returns the response. method
+        works as in riot.RiotClient.get.
+        """
+        self.start()
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self.shared(url, method), self.loop))
+
+    async def shared(self, url, method):
+        """
+        Joins the in-flight fetch for url, or starts one
+        """
+        flight = self.flights.get(url)
+        if flight is None:
+            flight = self.flights[url] = self.loop.create_task(self.fetch(url, method))
+            flight.add_done_callback(lambda _: self.flights.pop(url, None))
+        return await asyncio.shield(flight)
+
+    async def fetch(self, url, method):
+        """
+        Does the GET on the background loop, pacing it under the rate limits
+        """
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size))
+        if method is None:
+            return await self.http.get(url)
+        host = urlsplit(url).netloc.lower()
+        key = riot.key_id(url)
+        for attempt in range(self.max_retries + 1):
+            await self.loop.run_in_executor(None, self.limiter.acquire, host, method, key)
+            response = await self.http.get(url)
+            self.limiter.update(host, method, response, key)
+            if response.status_code != 429:
+                break
+        return response
+
+# Shared by every async request helper in the process
+client = AsyncRiotClient()
+
+async def get(url, method=None):
+    """
+    Sends a GET through the shared async client
+    """
+    return await client.get(url, method)
@@ -1,19 +1,45 @@
-from flask import Flask, render_template, request, session, redirect
+from flask import Flask, render_template, request, session, redirect, jsonify, stream_template
 from functools import wraps
-from werkzeug.security import check_password_hash, generate_password_hash
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import aioriot
+import asyncio
+import cache
+import hashing
+import hashlib
 import logging
+import matchcache
 import messaging
 import os
-import requests
+import riot
+import staticdata
 import datetime
-import json 
-from urllib.request import urlopen
 
 app = Flask(__name__)
 app.secret_key = os.environ['FLASK_SECRET_KEY'] 
 
 logging.basicConfig(level=logging.INFO)
 
+# Upper bound on concurrent summoner lookups for one TFT match
+PARTICIPANT_WORKERS = int(os.environ.get('PARTICIPANT_WORKERS', 8))
+
+# Most matches one history page may show, and how many of its matches are
+# fetched and processed at once
+MATCH_HISTORY_MAX = int(os.environ.get('MATCH_HISTORY_MAX', 20))
+MATCH_WORKERS = int(os.environ.get('MATCH_WORKERS', 4))
+
+# Seconds a stored summoner or ranked entry is trusted before asking Riot
+# again, and how long to wait on the store before giving up on it
+STORE_MAX_AGE_SUMMONER = float(os.environ.get('STORE_MAX_AGE_SUMMONER', 86400))
+STORE_MAX_AGE_LEAGUE = float(os.environ.get('STORE_MAX_AGE_LEAGUE', 600))
+STORE_TIMEOUT = float(os.environ.get('STORE_TIMEOUT', 0.5))
+
+# Seconds since the ingest worker last caught up on a player within which
+# their match IDs are read from the store instead of Riot
+STORE_MAX_AGE_MATCH_IDS = float(os.environ.get('STORE_MAX_AGE_MATCH_IDS', 300))
+
+# Keep the champion table current with Data Dragon
+staticdata.champions.start_refreshing()
+
 # tag::login_required[]
 def login_required(f):
     """
@@ -63,6 +89,12 @@ def processTFTResults():
         # 3) Process TFT Player Data
         playerTFTDataArr = processPlayerData(playerTFTData)
         
+        # 3.5) Have the backend fetch their newer matches in the background
+        requestIngest(region, playerTFTDataArr['puuid'], apikey)
+        
+        # 3.6) Running stats over every match of theirs the backend has stored
+        TFTStats = processTFTStats(fromStore('GETTFTSTATS', {'puuid': playerTFTDataArr['puuid']}, 'stats'))
+        
         #---Ranked Data---#
         
         # 4) Request TFT Ranked JSON Data
@@ -95,52 +127,130 @@ def processTFTResults():
             rk1 = str(rankedTFTDataArr['rank']),  
             lp1 = "LP : " + str(rankedTFTDataArr['leaguePoints']),
             playerName = str(playerTFTDataArr['name']),
-            TFTParticipantAndChampions = procTFTMatchHistoryDict)
+            TFTParticipantAndChampions = procTFTMatchHistoryDict,
+            TFTStats = TFTStats)
             
 # TFT 1) Get Most Recent Match ID
 def requestMatchID(puuid, apikey):
+    return requestMatchIDs(puuid, apikey, 0, 1)
+
+# TFT 1.5) Get a page of Match IDs, newest first, skipping the first `start`
+def requestMatchIDs(puuid, apikey, start, count):
     # Tailored URL using given input
-    URL = "https://americas.api.riotgames.com/tft/match/v1/matches/by-puuid/" + puuid + "/ids?count=1&api_key=" + apikey
+    URL = (riot.host("americas") + "/tft/match/v1/matches/by-puuid/" + puuid
+           + "/ids?start=" + str(start) + "&count=" + str(count) + "&api_key=" + apikey)
     print(URL)
-    response = requests.get(URL)
+    response = riot.get(URL, 'tft-match-v1.ids-by-puuid')
     return response.json()
     
 # TFT 2) Get Most Recent Match History w/ Match ID
 def requestMatchHistory(matchId, apikey):
     # Tailored URL using given input
-    URL = "https://americas.api.riotgames.com/tft/match/v1/matches/" + matchId[0] + "?api_key=" + apikey
+    URL = riot.host("americas") + "/tft/match/v1/matches/" + matchId[0] + "?api_key=" + apikey
     print(URL)
-    response = requests.get(URL)
-    return response.json()
+    # Matches never change once played, so a cached or stored one is always good
+    return matchcache.matches.get_or_fetch(
+        matchId[0], keyId(apikey),
+        lambda: storeFirst(
+            'GETTFTMATCH', {'matchId': matchId[0], 'keyId': keyId(apikey)}, 'match',
+            lambda: riot.get(URL, 'tft-match-v1.match').json(),
+            lambda match: {'match': match, 'keyId': keyId(apikey)}, 'PUTTFTMATCH'),
+        isFound)
     
 # TFT 3) Process Match History
 def processMatchHistory(matchHistory, region, apikey):
+    participants = matchHistory['info']['participants']
+    
+    # Look up every participant at once, map() hands them back in the same order
+    with ThreadPoolExecutor(max_workers=PARTICIPANT_WORKERS) as executor:
+        TFTPlayers = executor.map(
+            lambda player: requestTFTPlayerData(region, str(player['puuid']), apikey),
+            participants)
+    
+    return formatMatchHistory(participants, TFTPlayers)
+
+# TFT 3.1) Build the participant/champion table once every summoner is known
+def formatMatchHistory(participants, TFTPlayers):
     participantAndChampions = {}
     
-    for player in matchHistory['info']['participants']:
+    for player, TFTPlayerData in zip(participants, TFTPlayers):
         championsArr = [] # Clear the array for the next round of champions
-        TFTPlayerData = requestTFTPlayerData(region, str(player['puuid']), apikey)
         placement = processPlacement(player['placement'])
         Player = str(TFTPlayerData['name']) + " : Level " + str(player['level']) + " : " + str(placement)
         for unit in player['units']:
-            string = str(unit['character_id'])
-            if "TFT4_" in string:
-                string = string[5:]
-            elif "TFT4b_" in string:
-                string = string[6:]
-            Champion = "Tier " + str(unit['tier']) + " " +  string
+            Champion = "Tier " + str(unit['tier']) + " " +  unitName(unit['character_id'])
             championsArr.append(Champion)
         participantAndChampions[Player] = championsArr # Each Player will have an array of strings detailing Champions and their tiers
         
     return participantAndChampions  
 
+# TFT 3.1.5) Drop the set prefix from a unit's character_id
+def unitName(character_id):
+    string = str(character_id)
+    if "TFT4_" in string:
+        string = string[5:]
+    elif "TFT4b_" in string:
+        string = string[6:]
+    return string
+
+# TFT 3.1.6) Turn the backend's running stats into lines for the page
+def processTFTStats(stats):
+    if stats is None:
+        return None
+    return {
+        'games' : "Stored Games : " + str(stats['games']),
+        'averagePlacement' : "Average Placement : " + format(stats['averagePlacement'], '.2f'),
+        'top4Rate' : "Top 4 Rate : " + format(stats['top4Rate'], '.0%'),
+        'averageLevel' : "Average Level : " + format(stats['averageLevel'], '.1f'),
+        'placements' : {processPlacement(placement + 1): games
+                        for placement, games in enumerate(stats['placements'])},
+        'units' : ["Tier " + str(unit['tier']) + " " + unitName(unit['character_id'])
+                   + " : " + str(unit['games']) + " games" for unit in stats['units']] }
+
+# TFT 3.2) Fetch and process one match of a player's history
+def processMatch(matchId, region, apikey):
+    matchHistory = requestMatchHistory([matchId], apikey)
+    if not isFound(matchHistory):
+        return {'matchId': matchId, 'error': matchHistory['status']['message']}
+    played = datetime.datetime.fromtimestamp(matchHistory['info']['game_datetime'] / 1000)
+    return {
+        'matchId': matchId,
+        'played': played.strftime('%Y-%m-%d %H:%M'),
+        'participants': processMatchHistory(matchHistory, region, apikey)}
+
+# TFT 3.3) Process several matches at once, yielding each as soon as it is
+#          done. requestMatchHistory serves stored matches locally, so only
+#          the missing ones go to Riot and those already stored come first.
+def streamMatchHistory(matchIds, region, apikey):
+    executor = ThreadPoolExecutor(max_workers=MATCH_WORKERS)
+    try:
+        futures = {executor.submit(processMatch, matchId, region, apikey): matchId
+                   for matchId in matchIds}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception:
+                # A Riot timeout or a malformed match must not cut the page
+                # short; the rest of the history still streams
+                logging.exception(f"Match history: {futures[future]} failed")
+                yield {'matchId': futures[future], 'error': "This match could not be loaded"}
+    finally:
+        # The browser may have gone away; don't start matches nobody will see
+        executor.shutdown(wait=False, cancel_futures=True)
+
 # TFT 3.5) Get Player JSON Data (based on puuid)
 def requestTFTPlayerData(region, puuid, apikey):
     # Tailored URL using given input
-    URL = "https://" + region + ".api.riotgames.com/tft/summoner/v1/summoners/by-puuid/" + puuid + "?api_key=" + apikey
+    URL = riot.host(region) + "/tft/summoner/v1/summoners/by-puuid/" + puuid + "?api_key=" + apikey
     print(URL)
-    response = requests.get(URL)
-    return response.json()
+    return cache.responses.get_or_fetch(
+        'summoner-by-puuid', (region.lower(), puuid, keyId(apikey)),
+        lambda: storeFirst(
+            'GETSUMMONER', {'puuid': puuid, 'maxAge': STORE_MAX_AGE_SUMMONER}, 'summoner',
+            lambda: riot.get(URL, 'tft-summoner-v1.by-puuid').json(),
+            lambda summoner: {'summoner': summoner, 'region': region, 'keyId': keyId(apikey)},
+            'PUTSUMMONER'),
+        isFound, isNotFound)
     
 # TFT 3.6) Shawn made me make this.
 def processPlacement(placement):
@@ -157,6 +267,43 @@ def processPlacement(placement):
         placeNo = str(placement) + "th place"
         return placeNo
               
+# TFT History) Show the player's last `count` matches, `start` matches back,
+#              streaming each into the page as it is ready
+@app.route('/tft/history', methods=['POST'])
+def processTFTHistory():
+    region = request.form['region']
+    player = request.form['player']
+    apikey = request.form['apikey']
+    start = max(request.form.get('start', 0, type=int), 0)
+    count = min(max(request.form.get('count', 10, type=int), 1), MATCH_HISTORY_MAX)
+    
+    playerTFTData = requestPlayerData(region, player, apikey)
+    if not isFound(playerTFTData):
+        return render_template('tftHistory.html',
+            playerDataError = playerTFTData['status']['message'],
+            matches = [])
+    playerTFTDataArr = processPlayerData(playerTFTData)
+    requestIngest(region, playerTFTDataArr['puuid'], apikey)
+    
+    # Match IDs come from the store once the ingest worker has caught up
+    # on the player, otherwise from Riot
+    matchIds = fromStore('GETTFTMATCHIDS', {
+        'puuid': playerTFTDataArr['puuid'], 'keyId': keyId(apikey),
+        'start': start, 'count': count, 'maxAge': STORE_MAX_AGE_MATCH_IDS}, 'matchIds')
+    if matchIds is None or len(matchIds) < count:
+        matchIds = requestMatchIDs(playerTFTDataArr['puuid'], apikey, start, count)
+    if not isinstance(matchIds, list):
+        return render_template('tftHistory.html',
+            playerName = playerTFTDataArr['name'],
+            playerDataError = matchIds['status']['message'],
+            matches = [])
+    
+    return stream_template('tftHistory.html',
+        playerName = playerTFTDataArr['name'],
+        start = start,
+        count = len(matchIds),
+        matches = streamMatchHistory(matchIds, region, apikey))
+              
 # $tag::processResults[]
 @app.route('/league', methods=['GET'])
 # This is where the magic happens #
@@ -191,6 +338,9 @@ def processResults():
         # 3) Process Player Data
         playerDataArr = processPlayerData(playerData)
         
+        # 3.5) Have the backend fetch their newer matches in the background
+        requestIngest(region, playerDataArr['puuid'], apikey)
+        
         #---Ranked Data---#
         
         # 4) Request Ranked JSON Data
@@ -221,11 +371,72 @@ def processResults():
 # 1) Get Player JSON Data (Summoner V4)
 def requestPlayerData(region, player, apikey):
     # Tailored URL using given input
-    URL = "https://" + region + ".api.riotgames.com/lol/summoner/v4/summoners/by-name/" + player + "?api_key=" + apikey
+    URL = riot.host(region) + "/lol/summoner/v4/summoners/by-name/" + player + "?api_key=" + apikey
     print(URL)
-    response = requests.get(URL)
-    return response.json()
+    return cache.responses.get_or_fetch(
+        'summoner-by-name', (region.lower(), player.lower(), keyId(apikey)),
+        lambda: storeFirst(
+            'GETSUMMONER', summonerQuery(region, player, apikey), 'summoner',
+            lambda: riot.get(URL, 'summoner-v4.by-name').json(),
+            lambda summoner: {'summoner': summoner, 'region': region, 'keyId': keyId(apikey)},
+            'PUTSUMMONER'),
+        isFound, isNotFound)
     
+# 1.5) Helpers for the summoner cache
+#      Riot encrypts summoner IDs and puuids per API key, so cached profiles
+#      are only shared between lookups made with the same key
+def keyId(apikey):
+    return hashlib.sha256(apikey.encode()).hexdigest()[:16]
+
+def isFound(data):
+    return 'status' not in data
+
+#      A 404 is remembered briefly too, so repeated typos cost no Riot calls
+def isNotFound(data):
+    return 'status' in data and data['status'].get('status_code') == 404
+
+# 1.6) Helpers for the persistent store
+#      Ask the backend for data it has kept from earlier lookups. If it has
+#      none, is slow or is down, go to Riot and hand what came back to the
+#      backend to keep, without waiting for it to be written. Writes go to
+#      their own queue so they never hold up lookups and logins.
+def fromStore(action, query, field):
+    if not messaging.rpc.connected():
+        return None
+    try:
+        response = messaging.rpc.call(action, query, STORE_TIMEOUT)
+    except messaging.RPCError:
+        logging.info(f"Store: {action} unavailable, asking Riot")
+        return None
+    return response[field] if response.get('success') else None
+
+def storeFirst(action, query, field, fetch, save, saveAction):
+    stored = fromStore(action, query, field)
+    if stored is not None:
+        return stored
+    data = fetch()
+    if isFound(data):
+        messaging.rpc.send(saveAction, save(data), messaging.Messaging.store_queue_name)
+    return data
+
+def summonerQuery(region, player, apikey):
+    return {'region': region, 'name': player, 'keyId': keyId(apikey),
+            'maxAge': STORE_MAX_AGE_SUMMONER}
+
+def leagueQuery(ID, inWhere):
+    return {'summonerId': ID, 'game': inWhere, 'maxAge': STORE_MAX_AGE_LEAGUE}
+
+# 1.7) Queue a player for the backend's ingest worker, which stores their
+#      new TFT and League matches without holding up the page. A player is
+#      queued at most once per CACHE_TTL_INGEST_QUEUED.
+def requestIngest(region, puuid, apikey):
+    key = (puuid, keyId(apikey))
+    if not messaging.rpc.connected() or cache.responses.get('ingest-queued', key) is not None:
+        return
+    messaging.rpc.send('INGEST', {'puuid': puuid, 'region': region, 'apikey': apikey},
+                       messaging.Messaging.ingest_queue_name)
+    cache.responses.set('ingest-queued', key, True)
+
 # 2) Check Player Data
 #    Check if the player exists, if NOT, return render playerResult.html with error
 def checkPlayerData(playerData, playerDataResponseCode):
@@ -252,17 +463,17 @@ def processPlayerData(playerData):
 def requestRankedData(region, ID, APIKey, inWhere):
     # Tailored URL using given input
     if inWhere == 'TFT':
-        URL = "https://" + region + ".api.riotgames.com/tft/league/v1/entries/by-summoner/" + ID + "?api_key=" + APIKey
-        print(URL)
-        print('\n')
-        response = requests.get(URL)
-        return response.json()
+        URL = riot.host(region) + "/tft/league/v1/entries/by-summoner/" + ID + "?api_key=" + APIKey
+        method = 'tft-league-v1.entries-by-summoner'
     elif inWhere == 'League':
-        URL = "https://" + region + ".api.riotgames.com/lol/league/v4/entries/by-summoner/" + ID + "?api_key=" + APIKey
-        print(URL)
-        print('\n')
-        response = requests.get(URL)
-        return response.json()
+        URL = riot.host(region) + "/lol/league/v4/entries/by-summoner/" + ID + "?api_key=" + APIKey
+        method = 'league-v4.entries-by-summoner'
+    print(URL)
+    print('\n')
+    return storeFirst(
+        'GETLEAGUE', leagueQuery(ID, inWhere), 'entries',
+        lambda: riot.get(URL, method).json(),
+        lambda entries: {'summonerId': ID, 'game': inWhere, 'entries': entries}, 'PUTLEAGUE')
 
 # 5) Check Ranked Data
 def checkRankedData(rankedData, rankedDataResponseCode):
@@ -304,10 +515,10 @@ def processRankedData(rankedData):
 # 7) Get Spectator JSON Data (Spectator V4) 
 def requestSpectatorData(region, ID, APIKey, inWhere):
     # Tailored URL using given input
-    URL = "https://" + region + ".api.riotgames.com/lol/spectator/v4/active-games/by-summoner/" + ID + "?api_key=" + APIKey
+    URL = riot.host(region) + "/lol/spectator/v4/active-games/by-summoner/" + ID + "?api_key=" + APIKey
     print(URL)
     print('/n')
-    response = requests.get(URL)
+    response = riot.get(URL, 'spectator-v4.active-game')
     return response.json()
     
 # 8) Check Spectator Data
@@ -325,10 +536,7 @@ def processSpectatorData(spectatorData, redTeam, blueTeam):
         summonerName = spectatorData['participants'][i]['summonerName']
         teamId = spectatorData['participants'][i]['teamId']
         championId = spectatorData['participants'][i]['championId']
-        url = "https://ddragon.leagueoflegends.com/cdn/11.6.1/data/en_US/champion.json"
-        json_url = urlopen(url)
-        data = json.loads(json_url.read())
-        championName = champ_name(championId, data)
+        championName = champ_name(championId)
         gameLength = str(datetime.timedelta(seconds=spectatorData['gameLength']+150))
         gameMode = spectatorData['gameMode']
         gameMap = ""
@@ -348,12 +556,9 @@ def processSpectatorData(spectatorData, redTeam, blueTeam):
         'blueTeam' : blueTeam }
     return procSpectatorData
 
-# 9.5) Requesting from Data Dragon
-def champ_name(champ_id, dictionary):
-    for item in list(dictionary["data"].keys()):
-        if int(dictionary["data"][item]["key"]) == int(champ_id):
-            return item
-    return "champion does not exist"  
+# 9.5) Look up the champion in the Data Dragon table (loaded once per patch)
+def champ_name(champ_id):
+    return staticdata.champions.name(champ_id)
         
 # 10) Render the page based on the conditions method
 def renderResults(playerDataArr, rankedDataArr, spectatorDataArr, playerDataResponseCode, rankedDataResponseCode, spectatorDataResponseCode):
@@ -414,6 +619,187 @@ def renderResults(playerDataArr, rankedDataArr, spectatorDataArr, playerDataResp
             rankedError = "Player is not ranked : Error " + str(rankedDataResponseCode),
             spectatorError = "Player is not currently in a game: Error " + str(spectatorDataResponseCode))
 
+#---Async Handlers---#
+# Same steps as processResults and processTFTResults, but calls that only
+# depend on the summoner are awaited together. Served at /league/async and
+# /tft/async, or on the normal POST routes when RIOT_ASYNC is set.
+
+async def fromStoreAsync(action, query, field):
+    if not messaging.rpc.connected():
+        return None
+    try:
+        response = await messaging.rpc.call_async(action, query, STORE_TIMEOUT)
+    except messaging.RPCError:
+        logging.info(f"Store: {action} unavailable, asking Riot")
+        return None
+    return response[field] if response.get('success') else None
+
+async def storeFirstAsync(action, query, field, fetch, save, saveAction):
+    stored = await fromStoreAsync(action, query, field)
+    if stored is not None:
+        return stored
+    data = (await fetch()).json()
+    if isFound(data):
+        messaging.rpc.send(saveAction, save(data), messaging.Messaging.store_queue_name)
+    return data
+
+async def requestPlayerDataAsync(region, player, apikey):
+    URL = riot.host(region) + "/lol/summoner/v4/summoners/by-name/" + player + "?api_key=" + apikey
+    key = (region.lower(), player.lower(), keyId(apikey))
+    playerData = cache.responses.get('summoner-by-name', key)
+    if playerData is None:
+        playerData = await storeFirstAsync(
+            'GETSUMMONER', summonerQuery(region, player, apikey), 'summoner',
+            lambda: aioriot.get(URL, 'summoner-v4.by-name'),
+            lambda summoner: {'summoner': summoner, 'region': region, 'keyId': keyId(apikey)},
+            'PUTSUMMONER')
+        if isFound(playerData):
+            cache.responses.set('summoner-by-name', key, playerData)
+        elif isNotFound(playerData):
+            cache.responses.set('summoner-by-name', key, playerData, negative=True)
+    return playerData
+
+async def requestTFTPlayerDataAsync(region, puuid, apikey):
+    URL = riot.host(region) + "/tft/summoner/v1/summoners/by-puuid/" + puuid + "?api_key=" + apikey
+    key = (region.lower(), puuid, keyId(apikey))
+    TFTPlayerData = cache.responses.get('summoner-by-puuid', key)
+    if TFTPlayerData is None:
+        TFTPlayerData = await storeFirstAsync(
+            'GETSUMMONER', {'puuid': puuid, 'maxAge': STORE_MAX_AGE_SUMMONER}, 'summoner',
+            lambda: aioriot.get(URL, 'tft-summoner-v1.by-puuid'),
+            lambda summoner: {'summoner': summoner, 'region': region, 'keyId': keyId(apikey)},
+            'PUTSUMMONER')
+        if isFound(TFTPlayerData):
+            cache.responses.set('summoner-by-puuid', key, TFTPlayerData)
+        elif isNotFound(TFTPlayerData):
+            cache.responses.set('summoner-by-puuid', key, TFTPlayerData, negative=True)
+    return TFTPlayerData
+
+async def requestRankedDataAsync(region, ID, APIKey, inWhere):
+    if inWhere == 'TFT':
+        URL = riot.host(region) + "/tft/league/v1/entries/by-summoner/" + ID + "?api_key=" + APIKey
+        method = 'tft-league-v1.entries-by-summoner'
+    elif inWhere == 'League':
+        URL = riot.host(region) + "/lol/league/v4/entries/by-summoner/" + ID + "?api_key=" + APIKey
+        method = 'league-v4.entries-by-summoner'
+    return await storeFirstAsync(
+        'GETLEAGUE', leagueQuery(ID, inWhere), 'entries',
+        lambda: aioriot.get(URL, method),
+        lambda entries: {'summonerId': ID, 'game': inWhere, 'entries': entries}, 'PUTLEAGUE')
+
+async def requestSpectatorDataAsync(region, ID, APIKey):
+    URL = riot.host(region) + "/lol/spectator/v4/active-games/by-summoner/" + ID + "?api_key=" + APIKey
+    return (await aioriot.get(URL, 'spectator-v4.active-game')).json()
+
+async def requestMatchIDAsync(puuid, apikey):
+    URL = riot.host("americas") + "/tft/match/v1/matches/by-puuid/" + puuid + "/ids?count=1&api_key=" + apikey
+    return (await aioriot.get(URL, 'tft-match-v1.ids-by-puuid')).json()
+
+async def requestMatchHistoryAsync(matchId, apikey):
+    URL = riot.host("americas") + "/tft/match/v1/matches/" + matchId[0] + "?api_key=" + apikey
+    match = matchcache.matches.get(matchId[0], keyId(apikey))
+    if match is None:
+        match = await storeFirstAsync(
+            'GETTFTMATCH', {'matchId': matchId[0], 'keyId': keyId(apikey)}, 'match',
+            lambda: aioriot.get(URL, 'tft-match-v1.match'),
+            lambda match: {'match': match, 'keyId': keyId(apikey)}, 'PUTTFTMATCH')
+        if isFound(match):
+            matchcache.matches.set(matchId[0], keyId(apikey), match)
+    return match
+
+@app.route('/league/async', methods=['POST'])
+async def processResultsAsync():
+    playerDataResponseCode = 200
+    rankedDataResponseCode = 200
+    spectatorDataResponseCode = 200
+    region = request.form['region']
+    player = request.form['player']
+    apikey = request.form['apikey']
+    rankedDataArr = {}
+    spectatorDataArr = {}
+    
+    # 1-3) Player Data
+    playerData = await requestPlayerDataAsync(region, player, apikey)
+    checkPlayerData(playerData, playerDataResponseCode)
+    playerDataArr = processPlayerData(playerData)
+    requestIngest(region, playerDataArr['puuid'], apikey)
+    
+    # 4, 7) Ranked and Spectator Data only need the summoner ID
+    rankedData, spectatorData = await asyncio.gather(
+        requestRankedDataAsync(region, playerDataArr['ID'], apikey, 'League'),
+        requestSpectatorDataAsync(region, playerDataArr['ID'], apikey))
+    
+    # 5-6) Ranked Data
+    rankedDataResponseCode = checkRankedData(rankedData, rankedDataResponseCode)
+    if rankedDataResponseCode == 200:
+        rankedDataArr = processRankedData(rankedData)
+    
+    # 8-9) Spectator Data
+    spectatorDataResponseCode = checkSpectatorData(spectatorData, spectatorDataResponseCode)
+    if spectatorDataResponseCode == 200:
+        spectatorDataArr = processSpectatorData(spectatorData, {}, {})
+    
+    # 10) Render and return results
+    return renderResults(playerDataArr, rankedDataArr, spectatorDataArr, playerDataResponseCode, rankedDataResponseCode, spectatorDataResponseCode)
+
+@app.route('/tft/async', methods=['POST'])
+async def processTFTResultsAsync():
+    rankedTFTDataResponseCode = 200
+    region = request.form['region']
+    player = request.form['player']
+    apikey = request.form['apikey']
+    rankedTFTDataArr = {}
+    
+    # 1-3) Player Data
+    playerTFTData = await requestPlayerDataAsync(region, player, apikey)
+    checkPlayerData(playerTFTData, 200)
+    playerTFTDataArr = processPlayerData(playerTFTData)
+    requestIngest(region, playerTFTDataArr['puuid'], apikey)
+    
+    # 4, TFT 1, 3.6) Ranked Data, the latest Match ID and stats are independent
+    rankedTFTData, matchId, TFTStats = await asyncio.gather(
+        requestRankedDataAsync(region, playerTFTDataArr['ID'], apikey, 'TFT'),
+        requestMatchIDAsync(playerTFTDataArr['puuid'], apikey),
+        fromStoreAsync('GETTFTSTATS', {'puuid': playerTFTDataArr['puuid']}, 'stats'))
+    
+    # 5-6) Ranked Data
+    rankedTFTDataResponseCode = checkRankedData(rankedTFTData, rankedTFTDataResponseCode)
+    if rankedTFTDataResponseCode == 200:
+        rankedTFTDataArr = processRankedData(rankedTFTData)
+    
+    # TFT 2-3) Match History, with every participant looked up at once
+    matchHistory = await requestMatchHistoryAsync(matchId, apikey)
+    participants = matchHistory['info']['participants']
+    TFTPlayers = await asyncio.gather(*[
+        requestTFTPlayerDataAsync(region, str(participant['puuid']), apikey)
+        for participant in participants])
+    procTFTMatchHistoryDict = formatMatchHistory(participants, TFTPlayers)
+    
+    return render_template("playerTFTResults.html", 
+        pid = "Player ID : " + playerTFTDataArr['ID'],
+        acctID = "Account ID : " + playerTFTDataArr['accountId'],
+        puid = "Player Universely Unique Identifier : " + playerTFTDataArr['puuid'],
+        level = "Summoner Level : " + str(playerTFTDataArr['summonerLevel']),
+        tr1 = "Tier Rank for TFT: " + str(rankedTFTDataArr['tier']), 
+        rk1 = str(rankedTFTDataArr['rank']),  
+        lp1 = "LP : " + str(rankedTFTDataArr['leaguePoints']),
+        playerName = str(playerTFTDataArr['name']),
+        TFTParticipantAndChampions = procTFTMatchHistoryDict,
+        TFTStats = processTFTStats(TFTStats))
+
+if os.environ.get('RIOT_ASYNC'):
+    app.view_functions['processResults'] = processResultsAsync
+    app.view_functions['processTFTResults'] = processTFTResultsAsync
+
+@app.route('/metrics')
+def metrics():
+    return jsonify(rateLimit = riot.client.limiter.metrics(),
+                   coalesced = riot.client.flights.coalesced,
+                   cache = cache.responses.stats(),
+                   loginCache = cache.logins.stats(),
+                   matchCache = matchcache.matches.stats(),
+                   hashing = hashing.pool.metrics())
+
 @app.route('/secret')
 @login_required
 def secret():
@@ -425,16 +811,22 @@ def register():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
-        msg = messaging.Messaging()
-        msg.send(
-            'REGISTER',
-            {
-                'email': email,
-                'hash': generate_password_hash(password)
-            }
-        )
-        response = msg.receive()
+        try:
+            hashed = hashing.pool.generate(password)
+        except hashing.HashingBusy:
+            return "Registration is busy, please try again.", 503
+        try:
+            response = messaging.rpc.call(
+                'REGISTER',
+                {
+                    'email': email,
+                    'hash': hashed
+                }
+            )
+        except messaging.RPCError:
+            return "Registration is unavailable, please try again.", 504
         if response['success']:
+            cache.logins.delete('unknown-email', (email,))
             session['email'] = email
             return redirect('/')
         else:
@@ -448,12 +840,17 @@ def login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
-        msg = messaging.Messaging()
-        msg.send('GETHASH', { 'email': email })
-        response = msg.receive()
-        if response['success'] != True:
+        # Known not to exist: skip the backend entirely
+        if cache.logins.get('unknown-email', (email,)) is not None:
             return "Login failed."
-        if check_password_hash(response['hash'], password):
+        try:
+            # The backend checks the password; the hash never leaves it
+            response = messaging.rpc.call('VERIFY', { 'email': email, 'password': password })
+        except messaging.RPCError:
+            return "Login is unavailable, please try again.", 504
+        if response.get('message') == 'Unknown user':
+            cache.logins.set('unknown-email', (email,), True)
+        if response['success']:
             session['email'] = email
             return redirect('/')
         else:
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+# Seconds each endpoint's responses stay fresh
+TTLS = {
+    'summoner-by-name': float(os.environ.get('CACHE_TTL_SUMMONER_BY_NAME', 600)),
+    'summoner-by-puuid': float(os.environ.get('CACHE_TTL_SUMMONER_BY_PUUID', 3600)),
+    # Not a Riot response: marks a player as recently queued for ingestion
+    'ingest-queued': float(os.environ.get('CACHE_TTL_INGEST_QUEUED', 300)),
+}
+
+# Seconds a "does not exist" answer is remembered. Kept short so a newly
+# created summoner or account shows up soon.
+NEGATIVE_TTLS = {
+    'summoner-by-name': float(os.environ.get('CACHE_TTL_MISSING_SUMMONER', 60)),
+    'summoner-by-puuid': float(os.environ.get('CACHE_TTL_MISSING_SUMMONER', 60)),
+    'unknown-email': float(os.environ.get('CACHE_TTL_UNKNOWN_EMAIL', 30)),
+}
+
+class CacheBackend:
+    """
+    Interface for where cached values live. Keys are strings, values are
+    anything json can serialize.
+    """
+
+    def get(self, key):
+        """
+        Returns the value stored under key, or None if missing or expired
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """
+        Stores value under key for ttl seconds
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes key if present
+        """
+        raise NotImplementedError
+
+class MemoryBackend(CacheBackend):
+    """
+    Bounded in-process backend. Entries expire after their TTL and the least
+    recently used entry is evicted once maxsize is reached.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class RedisBackend(CacheBackend):
+    """
+    Backend shared by every front end replica through a Redis-compatible
+    server. Values are stored as JSON with the TTL enforced by the server.
+    A broken connection is logged and treated as a miss so lookups still
+    fall through to Riot.
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=float(os.environ.get('CACHE_TIMEOUT', 0.5)),
+            socket_connect_timeout=float(os.environ.get('CACHE_TIMEOUT', 0.5)))
+
+    def get(self, key):
+        try:
+            value = self.client.get(key)
+        except redis.RedisError:
+            logging.exception("Cache: get failed")
+            return None
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(key, json.dumps(value), px=int(ttl * 1000))
+        except redis.RedisError:
+            logging.exception("Cache: set failed")
+
+    def delete(self, key):
+        try:
+            self.client.delete(key)
+        except redis.RedisError:
+            logging.exception("Cache: delete failed")
+
+class ResponseCache:
+    """
+    Caches Riot responses per endpoint on top of a CacheBackend, applying
+    each endpoint's TTL and counting hits and misses.
+    """
+
+    def __init__(self, backend, ttls=TTLS, negative_ttls=NEGATIVE_TTLS, prefix='riot'):
+        self.backend = backend
+        self.ttls = ttls
+        self.negative_ttls = negative_ttls
+        self.prefix = prefix
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def key(self, endpoint, key):
+        """
+        Flattens (endpoint, key tuple) into the backend's string key
+        """
+        return self.prefix + ':' + endpoint + ':' + ':'.join(str(part) for part in key)
+
+    def count(self, counters, endpoint):
+        with self.lock:
+            counters[endpoint] = counters.get(endpoint, 0) + 1
+
+    def get(self, endpoint, key):
+        """
+        Returns the cached value for (endpoint, key), or None on a miss
+        """
+        value = self.backend.get(self.key(endpoint, key))
+        self.count(self.misses if value is None else self.hits, endpoint)
+        return value
+
+    def set(self, endpoint, key, value, negative=False):
+        """
+        Stores a value under (endpoint, key) for that endpoint's TTL, or its
+        negative TTL if the value records that something does not exist
+        """
+        ttls = self.negative_ttls if negative else self.ttls
+        self.backend.set(self.key(endpoint, key), value, ttls[endpoint])
+
+    def delete(self, endpoint, key):
+        """
+        Drops (endpoint, key) from the backend
+        """
+        self.backend.delete(self.key(endpoint, key))
+
+    def get_or_fetch(self, endpoint, key, fetch, cacheable=lambda value: True,
+                     missing=lambda value: False):
+        """
+        Returns the cached value, or calls fetch() and caches its result if
+        cacheable(result) is true. Results for which missing(result) is true
+        are cached under the short negative TTL instead.
+        """
+        value = self.get(endpoint, key)
+        if value is None:
+            value = fetch()
+            if cacheable(value):
+                self.set(endpoint, key, value)
+            elif missing(value):
+                self.set(endpoint, key, value, negative=True)
+        return value
+
+    def stats(self):
+        """
+        Returns hit/miss counters per endpoint and the backend in use
+        """
+        with self.lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+def backend_from_environment():
+    """
+    Uses the shared server named by CACHE_URL (e.g. redis://cache:6379/0)
+    when set, otherwise a per-process memory backend
+    """
+    url = os.environ.get('CACHE_URL')
+    if url:
+        logging.info(f"Cache: Using shared backend at {url}")
+        return RedisBackend(url)
+    return MemoryBackend()
+
+# Shared by every request in the process
+responses = ResponseCache(backend_from_environment())
+
+# Emails that failed to log in because no such user exists
+logins = ResponseCache(responses.backend, ttls=NEGATIVE_TTLS, prefix='login')
@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash
+
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class HashingBusy(Exception):
+    """
+    Raised when too many hashes are already queued
+    """
+
+class HashingPool:
+    """
+    Runs password hashing in a pool of worker processes so the CPU-heavy
+    work neither blocks Flask request threads nor holds the GIL they need.
+    At most max_queued jobs may be waiting or running; past that, calls
+    fail fast with HashingBusy instead of piling up.
+    """
+
+    def __init__(self, workers=None, max_queued=None):
+        self.workers = workers or int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+        self.max_queued = max_queued or int(os.environ.get('HASH_QUEUE_LIMIT', self.workers * 4))
+        self.executor = None
+        self.slots = threading.BoundedSemaphore(self.max_queued)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def run(self, fn, *args):
+        """
+        Runs fn(*args) in the pool and returns its result
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            logging.info("HashingPool: queue full, rejecting")
+            raise HashingBusy()
+        start = time.monotonic()
+        with self.lock:
+            self.queued += 1
+        try:
+            executor = self.pool()
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory); every job on this
+                # executor fails, so start a fresh one and try once more
+                logging.exception("HashingPool: worker died, restarting pool")
+                return self.pool(broken=executor).submit(fn, *args).result()
+        finally:
+            with self.lock:
+                self.queued -= 1
+                self.completed += 1
+                self.seconds += time.monotonic() - start
+            self.slots.release()
+
+    def pool(self, broken=None):
+        """
+        Returns the executor, creating it on first use or replacing broken.
+        Workers come from a forkserver (spawned where there is none) rather
+        than a fork of the Flask process, so they never inherit its threads
+        or the locks they held.
+        """
+        with self.lock:
+            if self.executor is None or self.executor is broken:
+                if broken is not None:
+                    broken.shutdown(wait=False)
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(START_METHOD))
+            return self.executor
+
+    def generate(self, password):
+        """
+        Returns a new salted hash of password
+        """
+        return self.run(generate_password_hash, password)
+
+    def metrics(self):
+        """
+        Returns queue depth and throughput counters
+        """
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'queue_limit': self.max_queued,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'mean_seconds': round(self.seconds / self.completed, 4) if self.completed else 0,
+            }
+
+# Shared by every request in the process
+pool = HashingPool()
@@ -0,0 +1,169 @@
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+class MatchCache:
+    """
+    Disk cache of TFT match JSON. A finished match never changes, so entries
+    have no TTL: each is a gzip-compressed file named after the match ID,
+    and the least recently used files are deleted once the directory grows
+    past max_bytes. Every front end replica mounts the same directory, so
+    lookups always check the disk and mark a file as used through its mtime,
+    and the size accounting is rebuilt from a directory scan every
+    rescan_every seconds. That keeps all of them to one max_bytes between
+    them.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, rescan_every=None):
+        self.directory = directory or os.environ.get(
+            'MATCH_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'matches'))
+        self.max_bytes = max_bytes or int(os.environ.get('MATCH_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        self.rescan_every = rescan_every or float(os.environ.get('MATCH_CACHE_RESCAN_SECONDS', 60))
+        self.lock = threading.Lock()
+        self.sizes = None
+        self.total = 0
+        self.next_scan = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def path(self, match_id, key_id):
+        """
+        Returns the file for a match. Match JSON lists participants by
+        puuid, which Riot encrypts per API key, so the key digest is part
+        of the name.
+        """
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_-]', '_', match_id)
+                            + '.' + key_id + '.json.gz')
+
+    def scan(self):
+        """
+        Returns {path: size} for every cached file, least recently used
+        first. Runs without the lock; the directory may hold many files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json.gz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return {path: size for mtime, path, size in sorted(entries)}
+
+    def refresh(self):
+        """
+        Rebuilds the size accounting from the directory if a scan is due
+        """
+        now = time.monotonic()
+        if now < self.next_scan:
+            return
+        sizes = self.scan()
+        with self.lock:
+            self.sizes = sizes
+            self.total = sum(sizes.values())
+            self.next_scan = now + self.rescan_every
+        logging.info(f"MatchCache: {len(sizes)} matches, {self.total} bytes in {self.directory}")
+
+    def get(self, match_id, key_id):
+        """
+        Returns the cached match, or None
+        """
+        path = self.path(match_id, key_id)
+        try:
+            size = os.stat(path).st_size
+            with gzip.open(path, 'rt') as file:
+                match = json.load(file)
+        except FileNotFoundError:
+            # Never cached, or evicted by another process
+            with self.lock:
+                if self.sizes is not None:
+                    self.total -= self.sizes.pop(path, 0)
+                self.misses += 1
+            return None
+        except (OSError, ValueError):
+            logging.exception(f"MatchCache: dropping unreadable {path}")
+            self.remove(path)
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            # Marks the file as recently used for every process
+            os.utime(path)
+        except OSError:
+            pass
+        with self.lock:
+            if self.sizes is not None:
+                self.total += size - self.sizes.pop(path, 0)
+                self.sizes[path] = size
+            self.hits += 1
+        return match
+
+    def set(self, match_id, key_id, match):
+        """
+        Stores a match, evicting the least recently used ones if the cache
+        is over max_bytes
+        """
+        path = self.path(match_id, key_id)
+        data = gzip.compress(json.dumps(match).encode())
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name so readers never see half a file
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+        self.refresh()
+        with self.lock:
+            self.total += len(data) - self.sizes.pop(path, 0)
+            self.sizes[path] = len(data)
+            while self.total > self.max_bytes and len(self.sizes) > 1:
+                oldest = next(iter(self.sizes))
+                self.total -= self.sizes.pop(oldest)
+                self.evicted += 1
+                try:
+                    os.remove(oldest)
+                except OSError:
+                    pass
+
+    def remove(self, path):
+        with self.lock:
+            if self.sizes is not None:
+                self.total -= self.sizes.pop(path, 0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_fetch(self, match_id, key_id, fetch, cacheable=lambda value: True):
+        """
+        Returns the cached match, or calls fetch() and caches its result if
+        cacheable(result) is true
+        """
+        match = self.get(match_id, key_id)
+        if match is None:
+            match = fetch()
+            if cacheable(match):
+                self.set(match_id, key_id, match)
+        return match
+
+    def stats(self):
+        self.refresh()
+        with self.lock:
+            return {
+                'entries': len(self.sizes or {}),
+                'bytes': self.total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evicted': self.evicted,
+            }
+
+# Shared by every request in the process
+matches = MatchCache()
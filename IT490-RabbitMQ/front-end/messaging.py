@@ -3,13 +3,34 @@ import json
 import time
 import logging
 import os
+import threading
+import uuid
+import asyncio
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+
+class RPCError(Exception):
+    """
+    Raised when a request gets no reply
+    """
+
+class RPCTimeout(RPCError):
+    """
+    Raised when no reply arrives for a request within the timeout
+    """
 
 class Messaging:
     """
-    Helper class for dealing with the messaging service
+    Settings for the messaging service, shared by RPCClient and app.py
     """
     request_queue_name = 'request'
 
+    # Fire-and-forget writes to the backend's store, consumed separately
+    # from request_queue_name so they never delay lookups and logins
+    store_queue_name = 'store'
+
+    # Players whose matches the backend should fetch in the background
+    ingest_queue_name = 'ingest'
+
     # Get credentials from the environment
     credentials = pika.PlainCredentials(os.environ['RABBITMQ_DEFAULT_USER'],
                                         os.environ['RABBITMQ_DEFAULT_PASS'])
@@ -17,57 +38,185 @@ class Messaging:
     # docker-compose will resolve this host to our messaging service
     host = 'messaging'
 
-    def __init__(self):
+    # Seconds a call waits for a reply
+    timeout = float(os.environ.get('MESSAGING_TIMEOUT', 5))
+
+
+class RPCClient:
+    """
+    Multiplexed RPC client. One background thread owns a single connection
+    and reply queue; any number of Flask threads or asyncio tasks can have
+    requests in flight at once. Pending requests are tracked by
+    correlation_id and their futures resolved as replies arrive.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or Messaging.timeout
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.connection = None
+        self.thread = None
+
+    def start(self):
         """
-        Establishes connection and creates queues as needed
+        Starts the I/O thread on first use
         """
-        logging.info("Messaging: Establishing connection")
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.host, credentials=self.credentials))
-        self.channel = self.connection.channel()
-        logging.info("Messaging: Creating queues")
-        self.channel.queue_declare(queue=self.request_queue_name)
-        self.result_queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
 
-    def __del__(self):
+    def run(self):
         """
-        Closes down the connection
+        Connects, consumes replies and reconnects with backoff if the
+        connection drops or anything else goes wrong on it. Requests pending
+        at the time fail with RPCError.
         """
-        logging.info("Messaging: Closing down connection")
-        self.connection.close()
+        wait_time = 1
+        while True:
+            try:
+                logging.info("RPCClient: Establishing connection")
+                self.connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=Messaging.host,
+                                              credentials=Messaging.credentials))
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=Messaging.request_queue_name)
+                self.channel.queue_declare(queue=Messaging.store_queue_name)
+                self.channel.queue_declare(queue=Messaging.ingest_queue_name)
+                self.result_queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+                self.channel.basic_consume(queue=self.result_queue, auto_ack=True,
+                                           on_message_callback=self.on_reply)
+                self.ready.set()
+                wait_time = 1
+                while True:
+                    self.connection.process_data_events(time_limit=1)
+            except Exception:
+                # Anything from pika, the messaging host not resolving, or a
+                # bug in a callback. The connection is dropped and rebuilt
+                # either way, so nothing is left waiting on a connection no
+                # thread is servicing.
+                logging.exception("RPCClient: connection lost")
+            self.ready.clear()
+            try:
+                if self.connection is not None and self.connection.is_open:
+                    self.connection.close()
+            except Exception:
+                pass
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(RPCError("Connection to messaging lost"))
+            time.sleep(wait_time)
+            wait_time = min(wait_time * 2, 60)
 
-    def send(self, action, data):
+    def on_reply(self, ch, method, properties, body):
         """
-        Sends an action and data to the request queue in JSON. Sets the
-        reply_to property to the custom result queue.
+        Resolves the future waiting on this reply's correlation_id
         """
-        logging.info(f"Messaging: send(action={action}, data={data})")
+        with self.lock:
+            future = self.pending.pop(properties.correlation_id, None)
+        if future is None:
+            logging.info(f"RPCClient: dropping stale reply {properties.correlation_id}")
+            return
+        try:
+            future.set_result(json.loads(body))
+        except ValueError:
+            future.set_exception(RPCError("Reply is not valid JSON"))
+        except InvalidStateError:
+            # The caller gave up (timed out or was cancelled) meanwhile
+            pass
 
+    def publish(self, correlation_id, action, body, queue=Messaging.request_queue_name):
+        """
+        Publishes an encoded request; runs on the I/O thread. Requests
+        without a correlation_id expect no reply.
+        """
+        # body may hold a password or API key, so only the action is logged
+        logging.info(f"RPCClient: send(action={action})")
         self.channel.basic_publish(
             exchange='',
-            routing_key=self.request_queue_name,
+            routing_key=queue,
             properties=pika.BasicProperties(
-                reply_to=self.result_queue),
-                body=json.dumps({'action': action, 'data': data}
-            )
+                reply_to=self.result_queue if correlation_id else None,
+                correlation_id=correlation_id),
+            body=body
         )
 
-    def receive(self):
+    def connected(self):
         """
-        Waits for a single message and returns it. Waits up to 1s, checking
-        every 0.1s.
+        Returns whether messaging is connected right now, without waiting
         """
-        attempts = 0
-        while True:
-            method_frame, properties, body = self.channel.basic_get(
-                self.result_queue, auto_ack=True)
-            if method_frame:
-                received = json.loads(body)
-                logging.info(f"Messaging: received={received}")
-                return received
-            elif attempts > 10:
-                logging.info("Messaging: receive did not get message") 
-                return None 
-            else:
-                time.sleep(0.1)
-                attempts += 1
+        self.start()
+        return self.ready.is_set()
+
+    def send(self, action, data, queue=Messaging.request_queue_name):
+        """
+        Publishes a request to queue without waiting for, or asking for, a
+        reply. Dropped with a log line if messaging is not connected.
+        """
+        if not self.connected():
+            logging.info(f"RPCClient: not connected, dropping {action}")
+            return
+        body = json.dumps({'action': action, 'data': data})
+        try:
+            self.connection.add_callback_threadsafe(
+                lambda: self.publish(None, action, body, queue))
+        except pika.exceptions.AMQPError:
+            logging.exception(f"RPCClient: could not send {action}")
+
+    def submit(self, action, data, timeout=None):
+        """
+        Sends a request and returns a concurrent.futures.Future for its reply.
+        Waits up to timeout seconds for messaging to be connected.
+        """
+        self.start()
+        future = Future()
+        # Encoded here so a request that is not valid JSON fails its caller
+        # rather than the I/O thread
+        body = json.dumps({'action': action, 'data': data})
+        if not self.ready.wait(timeout or self.timeout):
+            future.set_exception(RPCError("Messaging is not connected"))
+            return future
+        correlation_id = uuid.uuid4().hex
+        with self.lock:
+            self.pending[correlation_id] = future
+        try:
+            self.connection.add_callback_threadsafe(
+                lambda: self.publish(correlation_id, action, body))
+        except pika.exceptions.AMQPError as error:
+            self.forget(correlation_id)
+            future.set_exception(RPCError(str(error)))
+        future.correlation_id = correlation_id
+        return future
+
+    def forget(self, correlation_id):
+        with self.lock:
+            self.pending.pop(correlation_id, None)
+
+    def call(self, action, data, timeout=None):
+        """
+        Sends a request and blocks until its reply arrives. Raises
+        RPCTimeout after timeout seconds.
+        """
+        future = self.submit(action, data, timeout)
+        try:
+            return future.result(timeout or self.timeout)
+        except TimeoutError:
+            self.forget(future.correlation_id)
+            raise RPCTimeout(f"No reply to {action}")
+
+    async def call_async(self, action, data, timeout=None):
+        """
+        asyncio version of call()
+        """
+        future = self.submit(action, data, timeout)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.forget(future.correlation_id)
+            raise RPCTimeout(f"No reply to {action}")
+
+# Shared by every request in the process
+rpc = RPCClient()
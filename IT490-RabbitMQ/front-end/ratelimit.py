@@ -0,0 +1,190 @@
+import logging
+import os
+import threading
+import time
+
+class TokenBucket:
+    """
+    Allows `limit` calls per `window` seconds, refilling continuously
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.window)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Seconds until one token is available
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.window / self.limit
+
+    def take(self):
+        self.tokens -= 1
+
+    def sync(self, count, now):
+        """
+        Lowers our tokens to match the count Riot reports for this window
+        """
+        self.refill(now)
+        self.tokens = min(self.tokens, self.limit - count)
+
+def parse_limits(header):
+    """
+    Turns a header such as '20:1,100:120' into [(20, 1), (100, 120)]
+    """
+    limits = []
+    for part in (header or '').split(','):
+        if ':' in part:
+            limit, window = part.split(':')
+            limits.append((int(limit), int(window)))
+    return limits
+
+class RateLimiter:
+    """
+    Keeps outgoing Riot calls under the application and method rate limits.
+    Riot counts limits per API key and routing host (na1, americas, ...), so
+    they are tracked separately for every (host, key) pair and learned from
+    the X-App-Rate-Limit and X-Method-Rate-Limit headers. Callers block in
+    acquire() until every bucket they need has a token, and a 429's
+    Retry-After holds back the whole scope it applies to, for that key only.
+    A limiter with a share below 1 keeps to that fraction of every limit,
+    counting calls other processes made with the same key, so background
+    work leaves the rest of the quota to user-facing requests.
+    """
+
+    def __init__(self, default_app_limits=None, prune_every=None, share=1.0):
+        self.share = share
+        self.default_app_limits = parse_limits(
+            default_app_limits or os.environ.get('RIOT_APP_RATE_LIMIT', '20:1,100:120'))
+        self.prune_every = prune_every or float(os.environ.get('RIOT_RATE_LIMIT_PRUNE_SECONDS', 60))
+        self.buckets = {}
+        self.blocked_until = {}
+        self.used = {}
+        self.next_prune = time.monotonic() + self.prune_every
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def prune(self, now):
+        """
+        Forgets scopes idle for longer than their longest window, so API
+        keys that are never seen again do not pile up. Their buckets would
+        have refilled by now anyway. Call with the lock held.
+        """
+        for scope, used in list(self.used.items()):
+            window = max((bucket.window for bucket in self.buckets.get(scope, [])), default=0)
+            if now - used > window and self.blocked_until.get(scope, 0) <= now:
+                del self.used[scope]
+                self.buckets.pop(scope, None)
+                self.blocked_until.pop(scope, None)
+        self.next_prune = now + self.prune_every
+
+    def bucket(self, limit, window):
+        return TokenBucket(limit * self.share, window)
+
+    def scopes(self, host, method, key=None):
+        return [(host, key, 'app'), (host, key, method)]
+
+    def scope_buckets(self, scope):
+        if scope not in self.buckets and scope[2] == 'app':
+            self.buckets[scope] = [self.bucket(limit, window)
+                                   for limit, window in self.default_app_limits]
+        return self.buckets.get(scope, [])
+
+    def acquire(self, host, method, key=None):
+        """
+        Blocks until a call to method on host with the API key identified by
+        key is within every limit, then takes a token from each bucket.
+        Returns the seconds spent waiting.
+        """
+        start = time.monotonic()
+        queued = False
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    if now >= self.next_prune:
+                        self.prune(now)
+                    delay = 0
+                    for scope in self.scopes(host, method, key):
+                        delay = max(delay, self.blocked_until.get(scope, 0) - now)
+                        for bucket in self.scope_buckets(scope):
+                            delay = max(delay, bucket.delay(now))
+                    if delay <= 0:
+                        for scope in self.scopes(host, method, key):
+                            for bucket in self.scope_buckets(scope):
+                                bucket.take()
+                            self.used[scope] = now
+                        break
+                    if not queued:
+                        queued = True
+                        self.queued += 1
+                time.sleep(delay)
+        finally:
+            if queued:
+                with self.lock:
+                    self.queued -= 1
+        waited = time.monotonic() - start
+        if queued:
+            with self.lock:
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def update(self, host, method, response, key=None):
+        """
+        Learns limits and current counts from a response's headers, and
+        honours Retry-After on a 429
+        """
+        headers = response.headers
+        app_scope, method_scope = self.scopes(host, method, key)
+        with self.lock:
+            now = time.monotonic()
+            for scope, prefix in ((app_scope, 'X-App'), (method_scope, 'X-Method')):
+                self.used[scope] = now
+                limits = parse_limits(headers.get(prefix + '-Rate-Limit'))
+                if not limits:
+                    continue
+                buckets = {bucket.window: bucket for bucket in self.buckets.get(scope, [])}
+                self.buckets[scope] = [
+                    buckets[window] if window in buckets and buckets[window].limit == limit * self.share
+                    else self.bucket(limit, window)
+                    for limit, window in limits]
+                counts = {window: count for count, window in
+                          parse_limits(headers.get(prefix + '-Rate-Limit-Count'))}
+                for bucket in self.buckets[scope]:
+                    if bucket.window in counts:
+                        bucket.sync(counts[bucket.window], now)
+            if response.status_code == 429:
+                retry_after = float(headers.get('Retry-After', 1))
+                if headers.get('X-Rate-Limit-Type') == 'method':
+                    scope = method_scope
+                else:
+                    scope = app_scope
+                logging.info(f"RateLimiter: 429 on {scope}, holding for {retry_after}s")
+                self.blocked_until[scope] = now + retry_after
+
+    def metrics(self):
+        """
+        Returns the current queue depth and wait-time totals
+        """
+        with self.lock:
+            return {
+                'scopes': len(self.used),
+                'queued': self.queued,
+                'waits': self.waits,
+                'wait_seconds_total': round(self.wait_total, 3),
+                'wait_seconds_max': round(self.wait_max, 3),
+            }
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ratelimit
+import singleflight
+
+class RiotClient:
+    """
+    Helper class for talking to the Riot API. Keeps one keep-alive session
+    per host so repeated lookups reuse the same TCP/TLS connections instead
+    of handshaking on every call, and paces calls to stay under Riot's rate
+    limits.
+    """
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None):
+        """
+        Reads pool sizes and timeouts from the environment unless given
+        """
+        self.pool_size = pool_size or int(os.environ.get('RIOT_POOL_SIZE', 10))
+        self.timeout = (
+            connect_timeout or float(os.environ.get('RIOT_CONNECT_TIMEOUT', 3.05)),
+            read_timeout or float(os.environ.get('RIOT_READ_TIMEOUT', 10)))
+        self.max_retries = int(os.environ.get('RIOT_MAX_RETRIES', 3))
+        self.limiter = ratelimit.RateLimiter()
+        self.flights = singleflight.Group()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, host):
+        """
+        Returns the pooled session for a host, creating it on first use
+        """
+        with self.lock:
+            if host not in self.sessions:
+                logging.info(f"Riot: Opening connection pool for {host}")
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def get(self, url, method=None):
+        """
+        Sends a GET through the pool for the URL's host and returns the
+        response. When method names the Riot API method (e.g.
+        'summoner-v4.by-name') the call is scheduled under the host's rate
+        limits and retried after a 429. Identical calls already in flight
+        share that call's response.
+        """
+        return self.flights.do(url, lambda: self.fetch(url, method))
+
+    def fetch(self, url, method):
+        """
+        Does the actual GET for get(), which coalesces concurrent calls for
+        the same URL onto one fetch
+        """
+        host = urlsplit(url).netloc.lower()
+        if method is None:
+            return self.session(host).get(url, timeout=self.timeout)
+        key = key_id(url)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(host, method, key)
+            response = self.session(host).get(url, timeout=self.timeout)
+            self.limiter.update(host, method, response, key)
+            if response.status_code != 429:
+                break
+        return response
+
+    def close(self):
+        """
+        Closes every pooled connection
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+def key_id(url):
+    """
+    Returns a digest of the URL's api_key, so each user's key is rate
+    limited on its own without the key itself being kept around
+    """
+    apikey = parse_qs(urlsplit(url).query).get('api_key', [''])[0]
+    return hashlib.sha256(apikey.encode()).hexdigest()[:16]
+
+def host(region):
+    """
+    Returns the base URL for a region or routing value (na1, americas, ...).
+    Setting RIOT_BASE_URL (e.g. http://localhost:8000) sends every call to
+    that server instead, with the region as the first path segment.
+    """
+    base = os.environ.get('RIOT_BASE_URL')
+    if base:
+        return base.rstrip('/') + '/' + region.lower()
+    return 'https://' + region + '.api.riotgames.com'
+
+# Shared by every request helper in the process
+client = RiotClient()
+
+def get(url, method=None):
+    """
+    Sends a GET through the shared client
+    """
+    return client.get(url, method)
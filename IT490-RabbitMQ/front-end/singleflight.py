@@ -0,0 +1,53 @@
+import threading
+
+class Call:
+    """
+    One in-flight call that other threads can wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = 0
+
+class Group:
+    """
+    Collapses identical concurrent calls: while a call for a key is running,
+    other callers with the same key wait for it and get its result (or its
+    exception) instead of making their own.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs fn() unless a call for key is already in flight, and returns
+        its result
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.shared += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = Call()
+                leader = True
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as error:
+                call.error = error
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+
+import riot
+
+class ChampionStore:
+    """
+    Process-wide copy of Data Dragon's champion.json, indexed by the numeric
+    champion key. Loaded once per patch version and optionally refreshed in
+    the background when Data Dragon publishes a new patch.
+    """
+    base_url = os.environ.get('DDRAGON_BASE_URL', 'https://ddragon.leagueoflegends.com')
+
+    def __init__(self, version=None, refresh_interval=None):
+        """
+        version may be a patch number such as '11.6.1' or 'latest'
+        """
+        self.requested_version = version or os.environ.get('DDRAGON_VERSION', '11.6.1')
+        self.refresh_interval = refresh_interval or float(os.environ.get('DDRAGON_REFRESH', 3600))
+        self.version = None
+        self.names = {}
+        self.lock = threading.Lock()
+        self.loading = threading.Lock()
+        self.refresher = None
+
+    def latest_version(self):
+        """
+        Returns the newest patch number Data Dragon knows about
+        """
+        return riot.get(self.base_url + '/api/versions.json').json()[0]
+
+    def load(self, version):
+        """
+        Downloads champion.json for a patch and swaps in the new index
+        """
+        logging.info(f"ChampionStore: Loading champions for {version}")
+        url = self.base_url + '/cdn/' + version + '/data/en_US/champion.json'
+        data = riot.get(url).json()
+        names = {int(champion['key']): name for name, champion in data['data'].items()}
+        with self.lock:
+            self.version = version
+            self.names = names
+
+    def refresh(self):
+        """
+        Reloads the table if the wanted patch differs from the loaded one
+        """
+        version = self.requested_version
+        if version == 'latest':
+            version = self.latest_version()
+        if version != self.version:
+            self.load(version)
+
+    def start_refreshing(self):
+        """
+        Starts a daemon thread that calls refresh() every refresh_interval
+        seconds
+        """
+        if self.refresher is not None:
+            return
+        def run():
+            while True:
+                time.sleep(self.refresh_interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    logging.exception("ChampionStore: refresh failed")
+        self.refresher = threading.Thread(target=run, daemon=True)
+        self.refresher.start()
+
+    def name(self, champion_id):
+        """
+        Returns the champion name for a numeric champion id
+        """
+        if self.version is None:
+            with self.loading:
+                if self.version is None:
+                    self.refresh()
+        return self.names.get(int(champion_id), "champion does not exist")
+
+# Shared by every request in the process
+champions = ChampionStore()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The front end's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Clock:
+    """
+    Stands in for the time module: monotonic() only moves when a test
+    advances it or code under test sleeps
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Like the real clock, always moves on a little
+        self.now += max(seconds, 1e-6)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return Clock()
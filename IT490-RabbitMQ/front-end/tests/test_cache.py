@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+import cache
+
+@pytest.fixture
+def memory(monkeypatch, clock):
+    monkeypatch.setattr(cache, 'time', clock)
+    return cache.MemoryBackend(maxsize=2)
+
+def test_memory_round_trip(memory):
+    memory.set('a', {'puuid': 'x', 'level': 3}, 10)
+    assert memory.get('a') == {'puuid': 'x', 'level': 3}
+    assert memory.get('b') is None
+
+def test_memory_expires_after_ttl(memory, clock):
+    memory.set('a', 1, 10)
+    clock.advance(9.9)
+    assert memory.get('a') == 1
+    clock.advance(0.1)
+    assert memory.get('a') is None
+    assert 'a' not in memory.entries
+
+def test_memory_evicts_least_recently_used(memory):
+    memory.set('a', 1, 10)
+    memory.set('b', 2, 10)
+    # Reading a makes b the least recently used
+    assert memory.get('a') == 1
+    memory.set('c', 3, 10)
+    assert memory.get('b') is None
+    assert memory.get('a') == 1
+    assert memory.get('c') == 3
+
+def test_memory_set_replaces_and_refreshes(memory, clock):
+    memory.set('a', 1, 10)
+    memory.set('b', 2, 10)
+    memory.set('a', 'new', 20)
+    memory.set('c', 3, 10)
+    assert memory.get('b') is None
+    clock.advance(15)
+    assert memory.get('a') == 'new'
+
+def test_memory_delete(memory):
+    memory.set('a', 1, 10)
+    memory.delete('a')
+    memory.delete('missing')
+    assert memory.get('a') is None
+
+@pytest.fixture
+def redis_backend():
+    fakeredis = pytest.importorskip('fakeredis')
+    backend = cache.RedisBackend('redis://localhost:6379/0')
+    backend.client = fakeredis.FakeRedis()
+    return backend
+
+def test_redis_round_trip(redis_backend):
+    value = {'name': 'Ünïcode', 'ranks': [1, 2.5, None], 'nested': {'ok': True}}
+    redis_backend.set('riot:summoner-by-name:na1:someone', value, 60)
+    assert redis_backend.get('riot:summoner-by-name:na1:someone') == value
+    assert redis_backend.get('riot:summoner-by-name:na1:nobody') is None
+
+def test_redis_stores_json_with_server_ttl(redis_backend):
+    redis_backend.set('k', [1, 2], 1.5)
+    assert json.loads(redis_backend.client.get('k')) == [1, 2]
+    assert 0 < redis_backend.client.pttl('k') <= 1500
+
+def test_redis_delete(redis_backend):
+    redis_backend.set('k', 1, 60)
+    redis_backend.delete('k')
+    assert redis_backend.get('k') is None
+
+def test_redis_unreachable_is_a_miss(monkeypatch):
+    monkeypatch.setenv('CACHE_TIMEOUT', '0.2')
+    backend = cache.RedisBackend('redis://127.0.0.1:1/0')
+    backend.set('k', 1, 60)
+    backend.delete('k')
+    assert backend.get('k') is None
+
+@pytest.fixture
+def responses(memory):
+    memory.maxsize = 100
+    return cache.ResponseCache(memory, ttls={'summoner': 100}, negative_ttls={'summoner': 10})
+
+def test_negative_ttl_is_shorter(responses, clock):
+    calls = []
+    def fetch():
+        calls.append(1)
+        return {'status': 404}
+    def missing(value):
+        return value == {'status': 404}
+    lookup = lambda: responses.get_or_fetch('summoner', ('na1', 'nobody'), fetch,
+                                            cacheable=lambda value: False, missing=missing)
+    assert lookup() == {'status': 404}
+    assert lookup() == {'status': 404}
+    assert len(calls) == 1
+    clock.advance(10)
+    lookup()
+    assert len(calls) == 2
+
+def test_positive_ttl(responses, clock):
+    responses.get_or_fetch('summoner', ('na1', 'someone'), lambda: {'id': 1})
+    clock.advance(99)
+    assert responses.get('summoner', ('na1', 'someone')) == {'id': 1}
+    clock.advance(1)
+    assert responses.get('summoner', ('na1', 'someone')) is None
+
+def test_errors_are_not_cached(responses):
+    calls = []
+    def fetch():
+        calls.append(1)
+        return None
+    for _ in range(2):
+        responses.get_or_fetch('summoner', ('na1', 'x'), fetch,
+                               cacheable=lambda value: value is not None)
+    assert len(calls) == 2
+
+def test_stats_count_hits_and_misses(responses):
+    responses.get_or_fetch('summoner', ('na1', 'x'), lambda: 1)
+    responses.get('summoner', ('na1', 'x'))
+    assert responses.stats() == {'backend': 'MemoryBackend',
+                                 'hits': {'summoner': 1}, 'misses': {'summoner': 1}}
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+import matchcache
+
+MATCH = {'metadata': {'participants': ['p1', 'p2']}, 'info': {'game_datetime': 1}}
+
+@pytest.fixture
+def matches(tmp_path):
+    return matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6)
+
+def test_round_trip(matches):
+    assert matches.get('NA1_1', 'key-a') is None
+    matches.set('NA1_1', 'key-a', MATCH)
+    assert matches.get('NA1_1', 'key-a') == MATCH
+    assert matches.stats()['hits'] == 1
+    assert matches.stats()['misses'] == 1
+
+def test_entries_are_per_key(matches):
+    matches.set('NA1_1', 'key-a', MATCH)
+    assert matches.get('NA1_1', 'key-b') is None
+
+def test_match_ids_cannot_escape_directory(matches, tmp_path):
+    path = matches.path('../../etc/passwd', 'key-a')
+    assert os.path.dirname(path) == str(tmp_path)
+
+def test_evicts_least_recently_used(matches):
+    matches.set('NA1_1', 'key-a', MATCH)
+    size = matches.total
+    matches.max_bytes = size * 2
+    matches.set('NA1_2', 'key-a', MATCH)
+    # Reading 1 leaves 2 as the least recently used
+    matches.get('NA1_1', 'key-a')
+    matches.set('NA1_3', 'key-a', MATCH)
+    assert matches.get('NA1_2', 'key-a') is None
+    assert matches.get('NA1_1', 'key-a') == MATCH
+    assert matches.get('NA1_3', 'key-a') == MATCH
+    assert matches.stats()['evicted'] == 1
+    assert not os.path.exists(matches.path('NA1_2', 'key-a'))
+
+def test_existing_files_count_after_restart(matches, tmp_path):
+    matches.set('NA1_1', 'key-a', MATCH)
+    matches.set('NA1_2', 'key-a', MATCH)
+    restarted = matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6)
+    assert restarted.get('NA1_1', 'key-a') == MATCH
+    assert restarted.stats()['entries'] == 2
+    assert restarted.stats()['bytes'] == matches.total
+
+def test_unreadable_file_is_dropped(matches):
+    matches.set('NA1_1', 'key-a', MATCH)
+    path = matches.path('NA1_1', 'key-a')
+    with open(path, 'wb') as file:
+        file.write(b'not gzip')
+    assert matches.get('NA1_1', 'key-a') is None
+    assert not os.path.exists(path)
+    assert matches.stats()['entries'] == 0
+
+def test_get_or_fetch(matches):
+    calls = []
+    def fetch():
+        calls.append(1)
+        return MATCH
+    assert matches.get_or_fetch('NA1_1', 'key-a', fetch) == MATCH
+    assert matches.get_or_fetch('NA1_1', 'key-a', fetch) == MATCH
+    assert len(calls) == 1
+    assert matches.get_or_fetch('NA1_2', 'key-a', lambda: None,
+                                cacheable=lambda match: match is not None) is None
+    assert matches.get('NA1_2', 'key-a') is None
+
+def files(tmp_path):
+    return sorted(path.name.split('.')[0] for path in tmp_path.glob('*.json.gz'))
+
+def test_replicas_read_each_others_matches(matches, tmp_path):
+    other = matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6)
+    matches.set('NA1_1', 'key-a', MATCH)
+    assert other.get('NA1_1', 'key-a') == MATCH
+    assert other.stats()['hits'] == 1
+
+def test_match_evicted_by_another_replica_is_a_miss(matches, tmp_path):
+    other = matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6)
+    matches.set('NA1_1', 'key-a', MATCH)
+    other.set('NA1_2', 'key-a', MATCH)
+    matches.remove(matches.path('NA1_1', 'key-a'))
+    assert other.get('NA1_1', 'key-a') is None
+    assert other.stats()['entries'] == 1
+    assert other.stats()['bytes'] == os.path.getsize(other.path('NA1_2', 'key-a'))
+
+def test_replicas_share_max_bytes(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(matchcache, 'time', clock)
+    first = matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6, rescan_every=10)
+    second = matchcache.MatchCache(str(tmp_path), max_bytes=10 ** 6, rescan_every=10)
+    first.set('NA1_1', 'key-a', MATCH)
+    first.max_bytes = second.max_bytes = first.total * 2
+    second.set('NA1_2', 'key-a', MATCH)
+    second.set('NA1_3', 'key-a', MATCH)
+    assert files(tmp_path) == ['NA1_2', 'NA1_3']
+    # first only sees second's files once it rescans
+    first.set('NA1_4', 'key-a', MATCH)
+    assert files(tmp_path) == ['NA1_2', 'NA1_3', 'NA1_4']
+    clock.advance(10)
+    first.set('NA1_5', 'key-a', MATCH)
+    assert files(tmp_path) == ['NA1_4', 'NA1_5']
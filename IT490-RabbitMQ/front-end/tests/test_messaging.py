@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pika
+import pytest
+
+os.environ.setdefault('RABBITMQ_DEFAULT_USER', 'test')
+os.environ.setdefault('RABBITMQ_DEFAULT_PASS', 'test')
+
+import messaging
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+
+    def queue_declare(self, queue, exclusive=False):
+        return SimpleNamespace(method=SimpleNamespace(queue=queue or 'replies'))
+
+    def basic_consume(self, **kwargs):
+        pass
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.published.append((routing_key, properties, json.loads(body)))
+
+class FakeConnection:
+    """
+    Runs add_callback_threadsafe callbacks at once, and fails the first
+    process_data_events with error
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.is_open = True
+        self.fake_channel = FakeChannel()
+
+    def channel(self):
+        return self.fake_channel
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def process_data_events(self, time_limit=None):
+        raise self.error
+
+    def close(self):
+        self.is_open = False
+
+class Stop(BaseException):
+    pass
+
+@pytest.fixture
+def client(monkeypatch):
+    """
+    A client that looks connected, without an I/O thread
+    """
+    client = messaging.RPCClient(timeout=0.05)
+    monkeypatch.setattr(client, 'start', lambda: None)
+    client.connection = FakeConnection()
+    client.channel = client.connection.channel()
+    client.result_queue = 'replies'
+    client.ready.set()
+    return client
+
+def reply(client, correlation_id, body):
+    client.on_reply(None, None, SimpleNamespace(correlation_id=correlation_id), body)
+
+def test_replies_resolve_by_correlation_id(client):
+    first = client.submit('GETSUMMONER', {'name': 'a'})
+    second = client.submit('GETSUMMONER', {'name': 'b'})
+    routing_key, properties, body = client.channel.published[0]
+    assert routing_key == messaging.Messaging.request_queue_name
+    assert properties.reply_to == 'replies'
+    assert properties.correlation_id == first.correlation_id
+    assert body == {'action': 'GETSUMMONER', 'data': {'name': 'a'}}
+
+    reply(client, second.correlation_id, '{"success": true, "name": "b"}')
+    assert second.result(0) == {'success': True, 'name': 'b'}
+    assert not first.done()
+    # Late or unknown replies are dropped
+    reply(client, 'unknown', '{}')
+    reply(client, second.correlation_id, '{}')
+    assert not first.done()
+
+def test_reply_that_is_not_json_fails_only_its_call(client):
+    first = client.submit('VERIFY', {})
+    second = client.submit('VERIFY', {})
+    reply(client, first.correlation_id, b'not json')
+    with pytest.raises(messaging.RPCError):
+        first.result(0)
+    assert not second.done()
+
+def test_request_that_is_not_json_fails_its_caller(client):
+    with pytest.raises(TypeError):
+        client.submit('PUTSUMMONER', {'bad': object()})
+    assert client.pending == {}
+
+def test_send_asks_for_no_reply(client):
+    client.send('INGEST', {'puuid': 'p'}, queue=messaging.Messaging.ingest_queue_name)
+    routing_key, properties, body = client.channel.published[0]
+    assert routing_key == 'ingest'
+    assert properties.reply_to is None
+
+def test_call_times_out_and_forgets(client):
+    with pytest.raises(messaging.RPCTimeout):
+        client.call('GETSUMMONER', {})
+    assert client.pending == {}
+
+def test_call_async_times_out_and_forgets(client):
+    with pytest.raises(messaging.RPCTimeout):
+        asyncio.run(client.call_async('GETSUMMONER', {}))
+    assert client.pending == {}
+
+def test_submit_fails_fast_when_not_connected(client):
+    client.ready.clear()
+    future = client.submit('GETSUMMONER', {}, timeout=0.01)
+    with pytest.raises(messaging.RPCError):
+        future.result(0)
+
+@pytest.mark.parametrize('error', [pika.exceptions.StreamLostError('lost'), ValueError('bug')])
+def test_lost_connection_fails_pending_calls(monkeypatch, error):
+    client = messaging.RPCClient()
+    connection = FakeConnection(error)
+    monkeypatch.setattr(messaging.pika, 'BlockingConnection', lambda parameters: connection)
+    def sleep(seconds):
+        raise Stop()
+    monkeypatch.setattr(messaging, 'time', SimpleNamespace(sleep=sleep))
+    pending = messaging.Future()
+    client.pending['id'] = pending
+    with pytest.raises(Stop):
+        client.run()
+    assert not client.ready.is_set()
+    assert not connection.is_open
+    assert client.pending == {}
+    with pytest.raises(messaging.RPCError):
+        pending.result(0)
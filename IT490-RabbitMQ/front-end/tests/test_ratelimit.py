@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return ratelimit.RateLimiter('2:1')
+
+def response(status_code=200, **headers):
+    return SimpleNamespace(status_code=status_code,
+                           headers={name.replace('_', '-'): value for name, value in headers.items()})
+
+def test_parse_limits():
+    assert ratelimit.parse_limits('20:1,100:120') == [(20, 1), (100, 120)]
+    assert ratelimit.parse_limits('') == []
+    assert ratelimit.parse_limits(None) == []
+
+def test_token_bucket_refills_continuously(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    bucket = ratelimit.TokenBucket(10, 10)
+    for _ in range(10):
+        assert bucket.delay(clock.now) == 0
+        bucket.take()
+    assert bucket.delay(clock.now) == pytest.approx(1)
+    clock.advance(0.5)
+    assert bucket.delay(clock.now) == pytest.approx(0.5)
+
+def test_waits_for_default_app_limit(limiter):
+    assert limiter.acquire('na1', 'summoner', 'key-a') == 0
+    assert limiter.acquire('na1', 'summoner', 'key-a') == 0
+    assert limiter.acquire('na1', 'summoner', 'key-a') == pytest.approx(0.5)
+    assert limiter.metrics()['waits'] == 1
+
+def test_limits_are_per_host_and_key(limiter):
+    for _ in range(2):
+        limiter.acquire('na1', 'summoner', 'key-a')
+    assert limiter.acquire('na1', 'summoner', 'key-b') == 0
+    assert limiter.acquire('euw1', 'summoner', 'key-a') == 0
+
+def test_learns_method_limits_from_headers(limiter):
+    limiter.update('na1', 'match', response(
+        X_App_Rate_Limit='100:1', X_App_Rate_Limit_Count='1:1',
+        X_Method_Rate_Limit='1:10', X_Method_Rate_Limit_Count='1:10'), 'key-a')
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(10)
+    assert limiter.acquire('na1', 'summoner', 'key-a') == 0
+
+def test_app_429_holds_back_only_that_key(limiter):
+    limiter.update('na1', 'summoner', response(429, Retry_After='5'), 'key-a')
+    assert limiter.acquire('na1', 'summoner', 'key-b') == 0
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(5)
+
+def test_method_429_holds_back_only_that_method(limiter):
+    limiter.update('na1', 'match', response(429, Retry_After='3', X_Rate_Limit_Type='method'), 'key-a')
+    assert limiter.acquire('na1', 'summoner', 'key-a') == 0
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(3)
+
+def test_idle_scopes_are_forgotten(limiter, clock):
+    limiter.acquire('na1', 'summoner', 'key-a')
+    clock.advance(61)
+    limiter.acquire('na1', 'summoner', 'key-b')
+    assert limiter.metrics()['scopes'] == 2
+    assert ('na1', 'key-a', 'app') not in limiter.buckets
+
+def test_scopes_are_kept_within_their_window(limiter, clock):
+    limiter.update('na1', 'match', response(X_Method_Rate_Limit='1:120'), 'key-a')
+    limiter.acquire('na1', 'match', 'key-a')
+    clock.advance(61)
+    limiter.acquire('na1', 'summoner', 'key-b')
+    assert ('na1', 'key-a', 'match') in limiter.buckets
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(59)
+
+def test_blocked_scopes_are_kept(limiter, clock):
+    limiter.update('na1', 'summoner', response(429, Retry_After='90'), 'key-a')
+    clock.advance(61)
+    limiter.acquire('na1', 'summoner', 'key-b')
+    assert limiter.acquire('na1', 'summoner', 'key-a') == pytest.approx(29)
+
+def test_share_keeps_to_a_fraction_of_each_limit(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    limiter = ratelimit.RateLimiter('10:1', share=0.5)
+    for _ in range(5):
+        assert limiter.acquire('na1', 'match', 'key-a') == 0
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(0.2)
+
+def test_share_counts_calls_made_elsewhere(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    limiter = ratelimit.RateLimiter('10:1', share=0.5)
+    # Riot counts 48 of 100 calls already made in the window, by this or
+    # another process, so only 2 of our 50 are left
+    limiter.update('na1', 'match', response(X_App_Rate_Limit='100:120',
+                                            X_App_Rate_Limit_Count='48:120'), 'key-a')
+    assert limiter.acquire('na1', 'match', 'key-a') == 0
+    assert limiter.acquire('na1', 'match', 'key-a') == 0
+    assert limiter.acquire('na1', 'match', 'key-a') == pytest.approx(2.4)
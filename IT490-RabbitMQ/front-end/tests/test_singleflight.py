@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import singleflight
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def run_concurrently(group, key, fn, followers):
+    """
+    Starts a leader calling fn and followers joining it once it is in
+    flight. Returns the threads and a list they append results to.
+    """
+    results = []
+    def call():
+        try:
+            results.append(group.do(key, fn))
+        except Exception as error:
+            results.append(error)
+    leader = threading.Thread(target=call)
+    leader.start()
+    wait_for(lambda: key in group.calls)
+    threads = [threading.Thread(target=call) for _ in range(followers)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: group.coalesced == followers)
+    return [leader] + threads, results
+
+def test_concurrent_calls_share_one_result():
+    group = singleflight.Group()
+    release = threading.Event()
+    calls = []
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {'puuid': 'x'}
+    threads, results = run_concurrently(group, 'key', fn, followers=4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == [{'puuid': 'x'}] * 5
+    assert group.calls == {}
+
+def test_error_reaches_every_caller():
+    group = singleflight.Group()
+    release = threading.Event()
+    def fn():
+        release.wait(5)
+        raise ValueError("riot down")
+    threads, results = run_concurrently(group, 'key', fn, followers=2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_finished_calls_are_not_reused():
+    group = singleflight.Group()
+    calls = []
+    def fn():
+        calls.append(1)
+        return len(calls)
+    assert group.do('key', fn) == 1
+    assert group.do('key', fn) == 2
+    assert group.coalesced == 0
+
+def test_different_keys_run_separately():
+    group = singleflight.Group()
+    assert group.do('a', lambda: 'a') == 'a'
+    assert group.do('b', lambda: 'b') == 'b'
+    with pytest.raises(KeyError):
+        group.do('c', lambda: {}['missing'])
+    assert group.calls == {}